@@ -1,8 +1,10 @@
 from flask import Flask, request, jsonify
-import sqlite3
 import csv
 
+from db import get_read_connection, release_thread_connections
+
 app = Flask(__name__)
+app.teardown_appcontext(release_thread_connections)
 DATABASE = '/home/lighthouse/count.db'  # 替换为你的SQLite数据库文件路径
 
 def csv_to_dict(filename):
@@ -42,11 +44,10 @@ def get_race(subrace):
     return race
 
 def query_db(query, args=(), one=False):
-    con = sqlite3.connect(DATABASE)
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
     cur.execute(query, args)
     rv = cur.fetchall()
-    con.close()
+    cur.close()
     return (rv[0] if rv else None) if one else rv
 
 
@@ -0,0 +1,131 @@
+import random
+import time
+from datetime import datetime, timezone
+
+# 合成的请求数据，结构与 Coze 回调一致：
+#   /add_all_tweets: {"output": [{"data": {"freeBusy": {"post": [tweet, ...]}}}], "rune_names": [...]}
+#   /add_users:      {"output": [{"data": {"users": [user, ...]}}]}
+
+KEYWORDS = [
+    'DOG•GO•TO•THE•MOON', 'PUPS•WORLD•PEACE', 'RSIC•GENESIS•RUNE', 'BILLION•DOLLAR•CAT',
+    'SATOSHI•NAKAMOTO', 'DECENTRALIZED', 'LOBO•THE•WOLF•PUP', 'MEME•ECONOMICS',
+]
+
+WORDS = (
+    'bitcoin runes ordinals mint floor pump moon dog cat wolf meme chart whale buy sell hold '
+    'launch airdrop community holders volume breakout support resistance fractal unisat magic eden'
+).split()
+
+TWITTER_TIME_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+
+class PayloadGenerator:
+    """生成可复现的推文和用户请求，dup_ratio 控制与之前已生成 ID 重复的比例"""
+
+    def __init__(self, seed=0, user_count=5000, start_id=1800000000000000000, now=None):
+        self.random = random.Random(seed)
+        self.user_count = user_count
+        self.next_tweet_id = start_id
+        self.now = now or int(time.time())
+        self.issued_tweets = []
+        self.tweets_by_id = {}
+        self.issued_users = []
+
+    def screen_name(self, user_id):
+        return f"user_{user_id}"
+
+    def tweet(self, tweet_id, max_age=3 * 86400):
+        rng = self.random
+        user_id = rng.randrange(1, self.user_count + 1)
+        created = datetime.fromtimestamp(self.now - rng.randrange(max_age), timezone.utc)
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(8, 40)))
+        return {
+            'rest_id': str(tweet_id),
+            'full_text': text,
+            'created_at': created.strftime(TWITTER_TIME_FORMAT),
+            'favorite_count': int(rng.paretovariate(1.2)) - 1,
+            'retweet_count': int(rng.paretovariate(1.5)) - 1,
+            'reply_count': rng.randrange(20),
+            'quote_count': rng.randrange(5),
+            'lang': 'en',
+            'conversation_id_str': str(tweet_id),
+            'entities': {
+                'hashtags': [{'text': rng.choice(WORDS)} for _ in range(rng.randrange(3))],
+                'urls': [],
+                'user_mentions': [],
+            },
+            'user': {
+                'rest_id': user_id,
+                'screen_name': self.screen_name(user_id),
+                'name': f"User {user_id}",
+                'followers_count': rng.randrange(100, 500000),
+                'verified': rng.random() < 0.05,
+            },
+        }
+
+    def repeat_tweet(self, tweet_id):
+        """重复抓取到的推文：内容、作者、时间不变，只有互动计数增长"""
+        rng = self.random
+        tweet = dict(self.tweets_by_id[tweet_id])
+        tweet['favorite_count'] += rng.randrange(0, 5)
+        tweet['retweet_count'] += rng.randrange(0, 2)
+        tweet['reply_count'] += rng.randrange(0, 2)
+        self.tweets_by_id[tweet_id] = tweet
+        return tweet
+
+    def _tweet_ids(self, count, dup_ratio):
+        ids = []
+        for _ in range(count):
+            if self.issued_tweets and self.random.random() < dup_ratio:
+                ids.append(self.random.choice(self.issued_tweets))
+            else:
+                ids.append(self.next_tweet_id)
+                self.issued_tweets.append(self.next_tweet_id)
+                self.next_tweet_id += 1
+        return ids
+
+    def tweets_payload(self, items=5, tweets_per_item=20, dup_ratio=0.5):
+        """一次 /add_all_tweets 请求：items 个检索词，每个检索词 tweets_per_item 条推文"""
+        output = []
+        rune_names = []
+        for _ in range(items):
+            posts = []
+            for tweet_id in self._tweet_ids(tweets_per_item, dup_ratio):
+                if tweet_id in self.tweets_by_id:
+                    posts.append(self.repeat_tweet(tweet_id))
+                else:
+                    self.tweets_by_id[tweet_id] = self.tweet(tweet_id)
+                    posts.append(self.tweets_by_id[tweet_id])
+            output.append({'data': {'freeBusy': {'post': posts}}})
+            rune_names.append(self.random.choice(KEYWORDS))
+        return {'output': output, 'rune_names': rune_names}
+
+    def user(self, user_id):
+        rng = self.random
+        return {
+            'id': user_id,
+            'screen_name': self.screen_name(user_id),
+            'name': f"User {user_id}",
+            'description': ' '.join(rng.choice(WORDS) for _ in range(12)),
+            'location': rng.choice(['', 'Earth', 'Singapore', 'New York', 'Tokyo']),
+            'followers_count': rng.randrange(100, 500000),
+            'friends_count': rng.randrange(10, 5000),
+            'listed_count': rng.randrange(0, 500),
+            'favourites_count': rng.randrange(0, 100000),
+            'media_count': rng.randrange(0, 5000),
+            'created_at': 'Tue Feb 10 19:14:39 +0000 2009',
+            'profile_image_url_https': f"https://pbs.twimg.com/profile_images/{user_id}/avatar.jpg",
+            'verified': rng.random() < 0.05,
+        }
+
+    def users_payload(self, users=50, dup_ratio=0.5):
+        """一次 /add_users 请求，dup_ratio 的用户是之前出现过的"""
+        batch = []
+        for _ in range(users):
+            if self.issued_users and self.random.random() < dup_ratio:
+                user_id = self.random.choice(self.issued_users)
+            else:
+                user_id = self.random.randrange(1, self.user_count + 1)
+                self.issued_users.append(user_id)
+            batch.append(self.user(user_id))
+        return {'output': [{'data': {'users': batch}}]}
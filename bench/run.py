@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各读接口及其查询参数
+TWEETS_READS = [
+    ('get_tweets', '/get_tweets'),
+    ('get_tweets_formated', '/get_tweets_formated'),
+    ('analyze_keywords', '/analyze_keywords'),
+    ('search_tweets', '/search_tweets?q=bitcoin+moon'),
+]
+USERS_READS = [
+    ('get_user_stats', '/get_user_stats'),
+    ('get_user_follower_averages', '/get_user_follower_averages'),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies_ms):
+    return {
+        'count': len(latencies_ms),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 3),
+        'max_ms': round(max(latencies_ms), 3),
+    }
+
+
+class ClientTarget:
+    """进程内通过 Flask test client 调用，数据库由 TWEETS_DB_PATH 指定"""
+
+    def __init__(self, db_path, archive_dir):
+        import db
+        import tweets_v2
+        import user_v2
+        # db.DB_PATH 在首次导入时读取环境变量，若此前已被导入会指向线上库
+        if os.path.abspath(db.DB_PATH) != os.path.abspath(db_path):
+            raise RuntimeError(f"Services are bound to {db.DB_PATH}, expected {db_path}")
+        tweets_v2.raw_archive.directory = os.path.join(archive_dir, 'tweets')
+        user_v2.raw_archive.directory = os.path.join(archive_dir, 'users')
+        self.clients = {
+            'tweets': tweets_v2.app.test_client(),
+            'users': user_v2.app.test_client(),
+        }
+
+    def request(self, app, method, path, payload=None):
+        client = self.clients[app]
+        response = client.post(path, json=payload) if method == 'POST' else client.get(path)
+        response.get_data()
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTarget:
+    """调用本地已启动的服务"""
+
+    def __init__(self, tweets_url, users_url):
+        self.urls = {'tweets': tweets_url.rstrip('/'), 'users': users_url.rstrip('/')}
+
+    def request(self, app, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.urls[app] + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status = e.code
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, None
+
+
+def timed(target, app, method, path, payload=None):
+    started = time.perf_counter()
+    status, body = target.request(app, method, path, payload)
+    return (time.perf_counter() - started) * 1000, status, body
+
+
+def wait_for_jobs(target, job_urls, statuses, timeout=300):
+    """等待异步写入任务结束，任务失败计为 500，超时直接报错"""
+    deadline = time.monotonic() + timeout
+    for url in job_urls:
+        while True:
+            _, body = target.request('tweets', 'GET', url)
+            if body and body.get('status') in ('done', 'failed'):
+                status = 200 if body['status'] == 'done' else 500
+                statuses[status] = statuses.get(status, 0) + 1
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Ingest job {url} did not finish within {timeout}s")
+            time.sleep(0.01)
+
+
+def run_ingest(target, generator, args):
+    latencies = []
+    statuses = {}
+    job_statuses = {}
+    tweets_sent = 0
+    inserted = 0
+    job_urls = []
+    path = '/add_all_tweets?async=1' if args.async_ingest else '/add_all_tweets'
+
+    started = time.perf_counter()
+    for _ in range(args.payloads):
+        payload = generator.tweets_payload(args.items, args.tweets_per_item, args.dup_ratio)
+        elapsed, status, body = timed(target, 'tweets', 'POST', path, payload)
+        latencies.append(elapsed)
+        statuses[status] = statuses.get(status, 0) + 1
+        tweets_sent += args.items * args.tweets_per_item
+        if args.async_ingest and status == 202:
+            job_urls.append(body['status_url'])
+        elif body:
+            inserted += body.get('total_inserted', 0)
+    if job_urls:
+        wait_for_jobs(target, job_urls, job_statuses)
+    total = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result.update({
+        'tweets_sent': tweets_sent,
+        'tweets_inserted': inserted if not args.async_ingest else None,
+        'seconds': round(total, 3),
+        'tweets_per_sec': round(tweets_sent / total, 1),
+        'statuses': statuses,
+    })
+    if job_urls:
+        result['job_statuses'] = job_statuses
+    return result
+
+
+def run_users_ingest(target, generator, args):
+    latencies = []
+    statuses = {}
+    for _ in range(args.user_payloads):
+        payload = generator.users_payload(args.users_per_payload, args.dup_ratio)
+        elapsed, status, _ = timed(target, 'users', 'POST', '/add_users', payload)
+        latencies.append(elapsed)
+        statuses[status] = statuses.get(status, 0) + 1
+    if not latencies:
+        return None
+    result = summarize(latencies)
+    result['statuses'] = statuses
+    return result
+
+
+def failed_requests(results):
+    """统计各项中非 2xx 的请求数，返回 {名称: 个数}"""
+    sections = [('ingest', results['ingest']), ('users_ingest', results['users_ingest'])]
+    sections += list(results['reads'].items())
+    failures = {}
+    for name, stats in sections:
+        if not stats:
+            continue
+        for key in ('statuses', 'job_statuses'):
+            count = sum(n for status, n in stats.get(key, {}).items() if not 200 <= int(status) < 300)
+            if count:
+                failures[name] = failures.get(name, 0) + count
+    return failures
+
+
+def run_reads(target, args):
+    results = {}
+    for app, reads in (('tweets', TWEETS_READS), ('users', USERS_READS)):
+        for name, path in reads:
+            latencies = []
+            statuses = {}
+            for i in range(args.reads):
+                # 默认每次带不同参数绕过响应缓存，测的是真实查询耗时
+                request_path = path if args.cached else f"{path}{'&' if '?' in path else '?'}_bench={i}"
+                elapsed, status, _ = timed(target, app, 'GET', request_path)
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+            results[name] = summarize(latencies)
+            results[name]['statuses'] = statuses
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """对比两次结果中各接口 p50/p99 与写入吞吐的变化"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    old_rate, new_rate = old['ingest']['tweets_per_sec'], new['ingest']['tweets_per_sec']
+    print(f"{'ingest tweets/sec':32s} {old_rate:10.1f} -> {new_rate:10.1f} ({(new_rate / old_rate - 1) * 100:+.1f}%)")
+    for name, stats in new['reads'].items():
+        if name not in old['reads']:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            before, after = old['reads'][name][key], stats[key]
+            change = (after / before - 1) * 100 if before else 0.0
+            print(f"{name + ' ' + key:32s} {before:10.3f} -> {after:10.3f} ({change:+.1f}%)")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        compare(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description='写入吞吐与读接口延迟压测')
+    parser.add_argument('--db', help='数据库路径（client 模式），不存在时用 bench.seed 生成')
+    parser.add_argument('--rows', type=int, default=10000, help='生成数据库时的推文条数')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--tweets-url', default='http://127.0.0.1:5004')
+    parser.add_argument('--users-url', default='http://127.0.0.1:5010')
+    parser.add_argument('--payloads', type=int, default=50)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--tweets-per-item', type=int, default=20)
+    parser.add_argument('--user-payloads', type=int, default=20)
+    parser.add_argument('--users-per-payload', type=int, default=50)
+    parser.add_argument('--dup-ratio', type=float, default=0.5)
+    parser.add_argument('--async', dest='async_ingest', action='store_true', help='使用 ?async=1 写入')
+    parser.add_argument('--reads', type=int, default=50, help='每个读接口请求次数')
+    parser.add_argument('--cached', action='store_true', help='允许命中响应缓存')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='结果 JSON 路径，默认写到临时目录下的 <commit>_<time>.json')
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+    work_dir = tempfile.mkdtemp(prefix='tweets_bench_')
+
+    if args.mode == 'client':
+        db_path = os.path.abspath(args.db or os.path.join(work_dir, 'tweets.db'))
+        # 必须在导入任何仓库模块（包括 bench.seed）之前设置，db.DB_PATH 在导入时确定
+        os.environ['TWEETS_DB_PATH'] = db_path
+        if not os.path.exists(db_path):
+            from bench.seed import seed_database
+            seed_database(db_path, rows=args.rows)
+        target = ClientTarget(db_path, os.path.join(work_dir, 'archive'))
+    else:
+        db_path = None
+        target = HttpTarget(args.tweets_url, args.users_url)
+
+    from bench.payloads import PayloadGenerator
+    generator = PayloadGenerator(seed=args.seed, start_id=1900000000000000000)
+
+    results = {
+        'commit': git_commit(),
+        'started_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'params': {key: value for key, value in vars(args).items() if key != 'out'},
+        'db': db_path,
+        'ingest': run_ingest(target, generator, args),
+        'users_ingest': run_users_ingest(target, generator, args),
+        'reads': run_reads(target, args),
+    }
+
+    out = args.out or os.path.join(work_dir, f"{results['commit'] or 'unknown'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    ingest = results['ingest']
+    print(f"ingest: {ingest['tweets_per_sec']} tweets/s, p50 {ingest['p50_ms']} ms, p99 {ingest['p99_ms']} ms, "
+          f"statuses {ingest['statuses']}")
+    for name, stats in results['reads'].items():
+        print(f"{name}: p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, statuses {stats['statuses']}")
+    print(f"Results saved to {out}")
+
+    # 有失败请求时结果不可信，以非零状态退出
+    failures = failed_requests(results)
+    if failures:
+        print(f"Non-2xx responses: {failures}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
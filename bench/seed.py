@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from bench.payloads import KEYWORDS, PayloadGenerator
+from migrate_tweets_v2 import (
+    HOT_COLUMNS,
+    TABLES,
+    ensure_tweets_v2_schema,
+    rebuild_author_daily_stats,
+    rebuild_keyword_daily_stats,
+)
+from migrate_users_v2 import ensure_users_v2_schema
+from tweet_content import INSERT_CONTENT_SQL, compress_content
+from tweet_ingest import extract_hot_fields, normalize_keyword
+from user_ingest import write_users
+
+# alter_tweets_v2.py 之后的 tweets_v2 基础结构，常用列由 HOT_COLUMNS 补上
+BASE_TWEETS_V2_SQL = '''
+    CREATE TABLE IF NOT EXISTS tweets_v2 (
+        tweetID TEXT PRIMARY KEY,
+        Content TEXT,
+        CreatedAt TEXT,
+        userid TEXT,
+        keywords TEXT
+    )
+'''
+
+INSERT_TWEET_SQL = '''
+    INSERT OR IGNORE INTO tweets_v2 (
+        tweetID, Content, CreatedAt, userid, keywords,
+        full_text, screen_name, user_name, favorite_count, created_ts, retweet_count
+    ) VALUES (?, NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def seed_database(path, rows=10000, users=5000, days=90, batch_size=10000, with_content=True, seed=0, snapshots=10):
+    """生成一个包含 rows 条推文、users 个用户的 tweets.db，结构与线上迁移后一致
+
+    每个用户在 days 天内均匀生成 snapshots 次抓取，写入 user_snapshots。
+
+    先建表并批量写入，最后再建索引和全文索引，比逐条触发索引更新快得多。
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+
+    generator = PayloadGenerator(seed=seed, user_count=users)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    cursor = conn.cursor()
+
+    cursor.execute(BASE_TWEETS_V2_SQL)
+    for name, col_type in HOT_COLUMNS:
+        cursor.execute(f'ALTER TABLE tweets_v2 ADD COLUMN {name} {col_type}')
+    for table_sql in TABLES:
+        cursor.execute(table_sql)
+    ensure_users_v2_schema(cursor)
+
+    started = time.perf_counter()
+    written = 0
+    while written < rows:
+        count = min(batch_size, rows - written)
+        tweet_rows = []
+        contents = []
+        links = []
+        for tweet_id in range(generator.next_tweet_id, generator.next_tweet_id + count):
+            tweet = generator.tweet(tweet_id, max_age=days * 86400)
+            keyword = generator.random.choice(KEYWORDS)
+            hot = extract_hot_fields(tweet)
+            tweet_rows.append((tweet['rest_id'], tweet['created_at'], str(tweet['user']['rest_id']), keyword) + hot)
+            links.append((tweet['rest_id'], normalize_keyword(keyword), hot[4]))
+            if with_content:
+                contents.append((tweet['rest_id'], compress_content(json.dumps(tweet))))
+        generator.next_tweet_id += count
+
+        cursor.executemany(INSERT_TWEET_SQL, tweet_rows)
+        cursor.executemany(INSERT_CONTENT_SQL, contents)
+        cursor.executemany('INSERT OR IGNORE INTO tweet_keywords (tweetID, keyword_normalized, first_seen) VALUES (?, ?, ?)', links)
+        conn.commit()
+        written += count
+        print(f"Seeded {written}/{rows} tweets ({written / (time.perf_counter() - started):.0f} rows/s)")
+
+    now = int(time.time())
+    for round_index in range(snapshots):
+        crawled_at = now - (snapshots - 1 - round_index) * days * 86400 // snapshots
+        for start in range(1, users + 1, batch_size):
+            batch = [generator.user(user_id) for user_id in range(start, min(start + batch_size, users + 1))]
+            write_users(cursor, batch, now=crawled_at)
+    conn.commit()
+    print(f"Seeded {users} users x {snapshots} snapshots")
+
+    print("Building indexes...")
+    ensure_tweets_v2_schema(cursor)
+    conn.commit()
+    rebuild_keyword_daily_stats(conn)
+    rebuild_author_daily_stats(conn)
+    cursor.execute('ANALYZE')
+    conn.commit()
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+    print(f"Seeded {path} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成压测用的 tweets.db')
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=10000, help='推文条数，10k ~ 10M')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--snapshots', type=int, default=10, help='每个用户的快照次数')
+    parser.add_argument('--days', type=int, default=90, help='推文和用户快照分布在最近多少天内')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--no-content', action='store_true', help='不写入原始 JSON，生成更快')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    seed_database(args.path, args.rows, args.users, args.days, args.batch_size, not args.no_content, args.seed, args.snapshots)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,88 @@ import sqlite3
 from datetime import datetime
 import json
 
+USERS_V2_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS users_v2 (
+        user_id INTEGER PRIMARY KEY,
+        screen_name TEXT NOT NULL,
+        name TEXT,
+        description TEXT,
+        location TEXT,
+        followers_count INTEGER,
+        friends_count INTEGER,
+        listed_count INTEGER,
+        favourites_count INTEGER,
+        media_count INTEGER,
+        created_at TEXT,
+        profile_image_url TEXT,
+        verified BOOLEAN,
+        last_updated TEXT
+    )
+'''
+
+USERS_V2_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_screen_name ON users_v2(screen_name)',
+]
+
+# 每次抓取到用户时追加一条计数快照，users_v2 只保留最新状态
+USER_SNAPSHOTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS user_snapshots (
+        user_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,  -- UTC 秒级时间戳
+        followers_count INTEGER,
+        friends_count INTEGER,
+        listed_count INTEGER,
+        favourites_count INTEGER,
+        media_count INTEGER,
+        PRIMARY KEY (user_id, ts)
+    ) WITHOUT ROWID
+'''
+
+# 超过保留期的快照按小时、再按天压缩；bucket 为该时段起点的 UTC 秒级时间戳，
+# 计数列保存时段内最后一次快照的值，followers_sum / samples 用于跨层求均值
+USER_SNAPSHOT_TIERS = ['user_snapshots_hourly', 'user_snapshots_daily']
+
+USER_SNAPSHOT_TIER_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        user_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        samples INTEGER NOT NULL,  -- 有粉丝数的快照条数
+        followers_min INTEGER,
+        followers_max INTEGER,
+        followers_sum INTEGER NOT NULL DEFAULT 0,
+        last_ts INTEGER NOT NULL,
+        followers_count INTEGER,
+        friends_count INTEGER,
+        listed_count INTEGER,
+        favourites_count INTEGER,
+        media_count INTEGER,
+        PRIMARY KEY (user_id, bucket)
+    ) WITHOUT ROWID
+'''
+
+USER_SNAPSHOTS_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_user_snapshots_ts ON user_snapshots(ts)',
+] + [
+    f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)' for table in USER_SNAPSHOT_TIERS
+]
+
+# 读接口按层分别查询再合并，各层按时间互不重叠，从旧到新排列：
+# (表名, 时间列, 粉丝数之和, 有粉丝数的样本数, followers_count 对应的快照时间列)
+USER_FOLLOWER_TIERS = [
+    ('user_snapshots_daily', 'bucket', 'followers_sum', 'samples', 'last_ts'),
+    ('user_snapshots_hourly', 'bucket', 'followers_sum', 'samples', 'last_ts'),
+    ('user_snapshots', 'ts', 'followers_count', 'CASE WHEN followers_count IS NULL THEN 0 ELSE 1 END', 'ts'),
+]
+
+
+def create_user_snapshot_tables(cursor):
+    """创建快照表及各压缩层"""
+    cursor.execute(USER_SNAPSHOTS_TABLE_SQL)
+    for table in USER_SNAPSHOT_TIERS:
+        cursor.execute(USER_SNAPSHOT_TIER_TABLE_SQL.format(table=table))
+    for index_sql in USER_SNAPSHOTS_INDEXES:
+        cursor.execute(index_sql)
+
 def connect_db():
     """连接到数据库"""
     return sqlite3.connect('/home/lighthouse/tweets.db')
@@ -13,27 +95,13 @@ def create_user_table():
     
     try:
         # 创建用户表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users_v2 (
-                user_id INTEGER PRIMARY KEY,
-                screen_name TEXT NOT NULL,
-                name TEXT,
-                description TEXT,
-                location TEXT,
-                followers_count INTEGER,
-                friends_count INTEGER,
-                listed_count INTEGER,
-                favourites_count INTEGER,
-                media_count INTEGER,
-                created_at TEXT,
-                profile_image_url TEXT,
-                verified BOOLEAN,
-                last_updated TEXT
-            )
-        ''')
+        cursor.execute(USERS_V2_TABLE_SQL)
         
         # 创建索引
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_screen_name ON users_v2(screen_name)')
+        for index_sql in USERS_V2_INDEXES:
+            cursor.execute(index_sql)
+
+        create_user_snapshot_tables(cursor)
         
         conn.commit()
         print("User table created successfully")
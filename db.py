@@ -0,0 +1,137 @@
+import os
+import queue
+import sqlite3
+import threading
+
+# 各服务共用的 SQLite 连接管理，路径可以用环境变量覆盖
+DB_PATH = os.environ.get('TWEETS_DB_PATH', '/home/lighthouse/tweets.db')
+
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+# 每个 (db_path, readonly) 最多保留的空闲连接数，超出的在归还时关闭
+POOL_SIZE = 8
+
+_local = threading.local()
+
+# 连接池跨线程保留连接：Werkzeug 等每个请求新开一个线程的服务器上，
+# 线程级缓存随线程结束而丢弃，每个请求都要重新打开连接并设置 pragma
+_pools = {}
+_pools_lock = threading.Lock()
+
+# 数据版本表：写入方在提交前把对应 scope 的版本号加一，
+# 各个进程读取同一行即可判断缓存的结果是否过期
+DATA_VERSIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        updated_at INTEGER  -- 最近一次提交的 UTC 秒级时间戳
+    )
+'''
+
+BUMP_DATA_VERSION_SQL = '''
+    INSERT INTO data_versions (scope, version, updated_at) VALUES (?, 1, CAST(strftime('%s', 'now') AS INTEGER))
+    ON CONFLICT(scope) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+'''
+
+
+def _apply_pragmas(conn, readonly):
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    if not readonly:
+        # WAL 模式写入数据库文件后持久生效，读连接无需（也无法）再设置
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+
+
+def open_connection(db_path=DB_PATH, readonly=False, check_same_thread=True):
+    """新建一个已设置 pragma 的连接，调用方负责关闭"""
+    if readonly:
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    _apply_pragmas(conn, readonly)
+    return conn
+
+
+def _pool(key):
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return pool
+
+
+def _thread_connection(db_path, readonly):
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = (db_path, readonly)
+    conn = connections.get(key)
+    if conn is None:
+        try:
+            conn = _pool(key).get_nowait()
+        except queue.Empty:
+            # 池中的连接会在不同线程间传递，但同一时间只归一个线程使用
+            conn = open_connection(db_path, readonly, check_same_thread=False)
+        connections[key] = conn
+    return conn
+
+
+def get_connection(db_path=DB_PATH):
+    """当前线程的读写连接，从连接池借出，直到 release_thread_connections 归还前线程内复用，不要关闭"""
+    return _thread_connection(db_path, False)
+
+
+def get_read_connection(db_path=DB_PATH):
+    """当前线程的只读连接，供 GET 接口使用；WAL 模式下不会阻塞写入"""
+    return _thread_connection(db_path, True)
+
+
+def release_thread_connections(exc=None):
+    """把当前线程借出的连接归还连接池，未提交的事务回滚
+
+    各 Flask 应用用 app.teardown_appcontext(release_thread_connections) 在每个请求结束时调用。
+    """
+    connections = getattr(_local, 'connections', None) or {}
+    for key, conn in connections.items():
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            _pool(key).put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+    connections.clear()
+
+
+def close_thread_connections():
+    """关闭当前线程持有的所有连接"""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+def ensure_data_versions_table(cursor):
+    cursor.execute(DATA_VERSIONS_SQL)
+    cursor.execute('PRAGMA table_info(data_versions)')
+    if 'updated_at' not in {col[1] for col in cursor.fetchall()}:
+        cursor.execute('ALTER TABLE data_versions ADD COLUMN updated_at INTEGER')
+
+
+def bump_data_version(cursor, scope):
+    """在写入事务中调用，随事务一起提交"""
+    cursor.execute(BUMP_DATA_VERSION_SQL, (scope,))
+
+
+def get_data_version(cursor, scope):
+    """读取 scope 当前的 (版本, 更新时间)；表不存在时返回 None"""
+    try:
+        cursor.execute('SELECT version, updated_at FROM data_versions WHERE scope = ?', (scope,))
+    except sqlite3.OperationalError:
+        return None
+    row = cursor.fetchone()
+    return (row[0], row[1] or 0) if row else (0, 0)
@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from service_log import get_logger
+
+logger = get_logger('ingest_queue')
+
+
+class IngestQueue:
+    """后台写入队列：请求线程只负责入队，写线程批量取出任务并合并为一次提交
+
+    connect: 返回新数据库连接的函数，写线程独占这个连接
+    process: process(cursor, payload) -> result，不负责提交
+    on_commit: 可选，on_commit(conn) 在每组提交后调用
+    on_rollback: 可选，on_rollback(conn) 在整组回滚、关闭连接前调用
+    """
+
+    def __init__(self, connect, process, max_pending=1000, max_group=20,
+                 group_wait=0.05, max_jobs=10000, on_commit=None,
+                 on_rollback=None):
+        self.connect = connect
+        self.process = process
+        self.on_commit = on_commit
+        self.on_rollback = on_rollback
+        self.max_group = max_group
+        self.group_wait = group_wait
+        self.max_jobs = max_jobs
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _now(self):
+        return datetime.now(ZoneInfo("UTC")).strftime('%Y-%m-%d %H:%M:%S UTC')
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, payload):
+        """入队并返回 job_id；队列已满时抛出 queue.Full"""
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'submitted_at': self._now(),
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            # 只保留最近的任务状态
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        try:
+            self._queue.put_nowait((job_id, payload))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _next_group(self):
+        """阻塞等待第一个任务，随后在 group_wait 内尽量多取几个一起提交"""
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.group_wait
+        while len(jobs) < self.max_group:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return jobs
+
+    def _write_group(self, conn, jobs):
+        cursor = conn.cursor()
+        results = {}
+        for job_id, payload in jobs:
+            self._update(job_id, status='running')
+            # 每个任务一个 SAVEPOINT，单个任务失败不影响同组其他任务
+            if not conn.in_transaction:
+                cursor.execute('BEGIN')
+            cursor.execute('SAVEPOINT ingest_job')
+            try:
+                results[job_id] = self.process(cursor, payload)
+                cursor.execute('RELEASE SAVEPOINT ingest_job')
+            except Exception as e:
+                logger.exception("Ingest job %s failed: %s", job_id, e)
+                cursor.execute('ROLLBACK TO SAVEPOINT ingest_job')
+                cursor.execute('RELEASE SAVEPOINT ingest_job')
+                self._update(job_id, status='failed', error=str(e), finished_at=self._now())
+
+        conn.commit()
+        for job_id, result in results.items():
+            self._update(job_id, status='done', result=result, finished_at=self._now())
+        logger.info("Committed ingest group of %d jobs (%d succeeded)", len(jobs), len(results))
+
+        if self.on_commit is not None:
+            try:
+                self.on_commit(conn)
+            except Exception as e:
+                logger.exception("Ingest on_commit hook failed: %s", e)
+
+    def _run(self):
+        conn = None
+        while True:
+            jobs = self._next_group()
+            try:
+                if conn is None:
+                    conn = self.connect()
+                self._write_group(conn, jobs)
+            except Exception as e:
+                logger.exception("Ingest group commit failed: %s", e)
+                for job_id, _ in jobs:
+                    job = self.status(job_id)
+                    if job and job['status'] != 'failed':
+                        self._update(job_id, status='failed', error=str(e), finished_at=self._now())
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                        if self.on_rollback is not None:
+                            self.on_rollback(conn)
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
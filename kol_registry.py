@@ -0,0 +1,138 @@
+import csv
+import os
+import sys
+import threading
+import time
+
+from db import open_connection
+from service_log import get_logger
+
+logger = get_logger('kol_registry')
+
+KOLS_CSV = './data/kols.csv'
+MEME_KOLS_CSV = './data/meme_kols.csv'
+
+# 两次检查文件 mtime 的最小间隔（秒），避免每次查询都 stat
+CHECK_INTERVAL = 5
+
+KOLS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS kols (
+        source TEXT NOT NULL,
+        screen_name TEXT NOT NULL COLLATE NOCASE,
+        introduction TEXT,
+        PRIMARY KEY (source, screen_name)
+    )
+'''
+
+
+def get_influence_level(influence):
+    try:
+        influence_value = int(influence)
+        if influence_value == 1:
+            return "低"
+        elif influence_value == 2:
+            return "中"
+        elif influence_value == 3:
+            return "高"
+        elif influence_value > 3:
+            return "超高"
+        else:
+            return "未知"
+    except ValueError:
+        return "未知"
+
+
+class KolFile:
+    """一个 KOL CSV 文件（userid,introduction,...）的内存副本
+
+    首次使用时加载，之后发现 mtime 变化就整体重新加载并替换快照，
+    读取方拿到的总是一份完整的快照。
+    """
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0
+        # (按文件顺序的 userid 列表, 小写 userid -> introduction)
+        self._snapshot = ([], {})
+
+    def _load(self, mtime):
+        userids = []
+        by_name = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                userid = (row.get('userid') or '').strip()
+                if not userid:
+                    continue
+                userids.append(userid)
+                by_name[userid.lower()] = (row.get('introduction') or '').strip()
+        self._snapshot = (userids, by_name)
+        self._mtime = mtime
+        logger.info("Loaded %d KOL records from %s", len(userids), self.path)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if self._mtime is not None and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self._mtime:
+                    self._load(mtime)
+            except OSError as e:
+                # 文件暂时不可读时继续使用上一次的数据
+                logger.warning("Error reading %s: %s", self.path, e)
+
+    def snapshot(self):
+        self._refresh()
+        return self._snapshot
+
+    def userids(self):
+        return self.snapshot()[0]
+
+    def get(self, screen_name, default=None):
+        """按 screen_name 查找 introduction，不区分大小写"""
+        if not screen_name:
+            return default
+        return self.snapshot()[1].get(screen_name.lower(), default)
+
+    def __contains__(self, screen_name):
+        return bool(screen_name) and screen_name.lower() in self.snapshot()[1]
+
+
+kols = KolFile(KOLS_CSV)
+meme_kols = KolFile(MEME_KOLS_CSV)
+
+
+def influence_level(screen_name):
+    """meme_kols.csv 中的影响力数字对应的等级，不在名单中时为"未知" """
+    return get_influence_level(meme_kols.get(screen_name, "未知"))
+
+
+def sync_kols_table(conn):
+    """把两个 CSV 写入 kols 表，便于在 SQL 中 JOIN"""
+    cursor = conn.cursor()
+    cursor.execute(KOLS_TABLE_SQL)
+    for source, kol_file in (('kols', kols), ('meme_kols', meme_kols)):
+        userids, by_name = kol_file.snapshot()
+        cursor.execute('DELETE FROM kols WHERE source = ?', (source,))
+        cursor.executemany(
+            'INSERT OR REPLACE INTO kols (source, screen_name, introduction) VALUES (?, ?, ?)',
+            [(source, userid, by_name[userid.lower()]) for userid in userids]
+        )
+    conn.commit()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'sync':
+        conn = open_connection()
+        sync_kols_table(conn)
+        conn.close()
+        print(f"Synced {len(kols.userids())} kols and {len(meme_kols.userids())} meme kols")
+    else:
+        print("用法: python kol_registry.py sync")
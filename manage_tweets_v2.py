@@ -1,19 +1,35 @@
 import sqlite3
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-DB_PATH = '/home/lighthouse/tweets.db'
+from db import bump_data_version, open_connection
+from tweet_content import load_raw_tweets
 
 def connect_to_db():
-    return sqlite3.connect(DB_PATH)
+    return open_connection()
+
+def attach_content(cursor, tweets):
+    """把解压后的原始推文放回每条记录的 Content 字段"""
+    raw_tweets = load_raw_tweets(cursor, [tweet['tweetID'] for tweet in tweets])
+    for tweet in tweets:
+        tweet['Content'] = raw_tweets.get(tweet['tweetID'])
+
+# 由 tweets_v2 派生的表，清空时需一起清掉，否则统计接口仍会返回旧数据
+DERIVED_TABLES = ['tweet_content', 'tweet_keywords', 'keyword_daily_stats', 'author_daily_stats']
 
 def clear_tweets_v2_table(cursor):
-    """清空tweets_v2表"""
+    """清空tweets_v2表及其派生表（不提交），并递增 'tweets' 和 'tweets_reset' 数据版本"""
     try:
         cursor.execute('DELETE FROM tweets_v2;')
+        for table in DERIVED_TABLES:
+            cursor.execute(f'DELETE FROM {table};')
+        bump_data_version(cursor, 'tweets')
+        # rowid 会从 1 重新开始，通知 SSE 分发从头开始
+        bump_data_version(cursor, 'tweets_reset')
         print("成功清空tweets_v2表")
         return True
     except sqlite3.Error as e:
+        cursor.connection.rollback()
         print(f"清空表时发生错误: {e}")
         return False
 
@@ -21,63 +37,62 @@ def get_all_tweets(cursor, limit=None):
     """获取所有推文数据"""
     try:
         if limit:
-            cursor.execute('SELECT * FROM tweets_v2 ORDER BY CreatedAt DESC LIMIT ?', (limit,))
+            cursor.execute('SELECT * FROM tweets_v2 ORDER BY created_ts DESC LIMIT ?', (limit,))
         else:
-            cursor.execute('SELECT * FROM tweets_v2 ORDER BY CreatedAt DESC')
+            cursor.execute('SELECT * FROM tweets_v2 ORDER BY created_ts DESC')
         
         columns = [description[0] for description in cursor.description]
         tweets = []
         
         for row in cursor.fetchall():
             tweet_dict = dict(zip(columns, row))
-            # 解析Content字段的JSON
-            if tweet_dict['Content']:
-                tweet_dict['Content'] = json.loads(tweet_dict['Content'])
             tweets.append(tweet_dict)
             
+        attach_content(cursor, tweets)
         return tweets
     except sqlite3.Error as e:
         print(f"获取推文数据时发生错误: {e}")
         return None
 
 def get_tweets_by_date_range(cursor, start_date, end_date):
-    """获取指定日期范围内的推文"""
+    """获取指定日期范围内的推文（UTC 日期，包含结束日期当天）"""
     try:
+        start_ts = int(datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+        end_ts = int((datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                      + timedelta(days=1)).timestamp())
         query = '''
         SELECT * FROM tweets_v2 
-        WHERE CreatedAt BETWEEN ? AND ?
-        ORDER BY CreatedAt DESC
+        WHERE created_ts >= ? AND created_ts < ?
+        ORDER BY created_ts DESC
         '''
-        cursor.execute(query, (start_date, end_date))
+        cursor.execute(query, (start_ts, end_ts))
         
         columns = [description[0] for description in cursor.description]
         tweets = []
         
         for row in cursor.fetchall():
             tweet_dict = dict(zip(columns, row))
-            if tweet_dict['Content']:
-                tweet_dict['Content'] = json.loads(tweet_dict['Content'])
             tweets.append(tweet_dict)
             
+        attach_content(cursor, tweets)
         return tweets
-    except sqlite3.Error as e:
+    except (sqlite3.Error, ValueError) as e:
         print(f"获取日期范围内的推文时发生错误: {e}")
         return None
 
 def get_tweets_by_userid(cursor, userid):
     """获取指定用户ID的推文"""
     try:
-        cursor.execute('SELECT * FROM tweets_v2 WHERE userid = ? ORDER BY CreatedAt DESC', (userid,))
+        cursor.execute('SELECT * FROM tweets_v2 WHERE userid = ? ORDER BY created_ts DESC', (userid,))
         
         columns = [description[0] for description in cursor.description]
         tweets = []
         
         for row in cursor.fetchall():
             tweet_dict = dict(zip(columns, row))
-            if tweet_dict['Content']:
-                tweet_dict['Content'] = json.loads(tweet_dict['Content'])
             tweets.append(tweet_dict)
             
+        attach_content(cursor, tweets)
         return tweets
     except sqlite3.Error as e:
         print(f"获取用户推文时发生错误: {e}")
@@ -93,8 +108,7 @@ def get_tweet_by_id(cursor, tweet_id):
         
         if row:
             tweet_dict = dict(zip(columns, row))
-            if tweet_dict['Content']:
-                tweet_dict['Content'] = json.loads(tweet_dict['Content'])
+            attach_content(cursor, [tweet_dict])
             return tweet_dict
         return None
     except sqlite3.Error as e:
@@ -117,10 +131,11 @@ def print_table_info(cursor):
         print(f"\n总记录数: {count}")
         
         # 获取最早和最新的记录时间
-        cursor.execute("SELECT MIN(CreatedAt), MAX(CreatedAt) FROM tweets_v2;")
-        min_date, max_date = cursor.fetchone()
-        print(f"最早记录时间: {min_date}")
-        print(f"最新记录时间: {max_date}")
+        cursor.execute("SELECT MIN(created_ts), MAX(created_ts) FROM tweets_v2;")
+        min_ts, max_ts = cursor.fetchone()
+        if min_ts is not None:
+            print(f"最早记录时间: {datetime.fromtimestamp(min_ts, timezone.utc)}")
+            print(f"最新记录时间: {datetime.fromtimestamp(max_ts, timezone.utc)}")
         
         # 获取不同用户数量
         cursor.execute("SELECT COUNT(DISTINCT userid) FROM tweets_v2 WHERE userid IS NOT NULL AND userid != '';")
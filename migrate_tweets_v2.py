@@ -0,0 +1,363 @@
+import json
+import sys
+import time
+
+from db import bump_data_version, ensure_data_versions_table, open_connection
+from tweet_content import CONTENT_TABLE_SQL, INSERT_CONTENT_SQL, compress_content, load_raw_contents
+from tweet_ingest import extract_hot_fields
+
+# 从 Content 中拆出来的常用字段，读接口只查这些列
+HOT_COLUMNS = [
+    ('full_text', 'TEXT'),
+    ('screen_name', 'TEXT'),
+    ('user_name', 'TEXT'),
+    ('favorite_count', 'INTEGER'),
+    ('created_ts', 'INTEGER'),  # UTC 秒级时间戳
+    ('retweet_count', 'INTEGER'),
+]
+
+# 派生表
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS tweet_keywords (
+        tweetID TEXT NOT NULL,
+        keyword_normalized TEXT NOT NULL,
+        first_seen INTEGER NOT NULL,
+        PRIMARY KEY (tweetID, keyword_normalized)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS keyword_daily_stats (
+        keyword TEXT NOT NULL,
+        day TEXT NOT NULL,  -- UTC 日期 YYYY-MM-DD
+        posts INTEGER NOT NULL DEFAULT 0,
+        likes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (keyword, day)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS author_daily_stats (
+        userid TEXT NOT NULL,
+        day TEXT NOT NULL,  -- UTC 日期 YYYY-MM-DD
+        screen_name TEXT,
+        tweets INTEGER NOT NULL DEFAULT 0,
+        likes INTEGER NOT NULL DEFAULT 0,
+        retweets INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (userid, day)
+    ) WITHOUT ROWID
+    ''',
+    CONTENT_TABLE_SQL,
+]
+
+# 时间窗口查询依赖的索引
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_tweets_v2_created_ts ON tweets_v2(created_ts)',
+    'CREATE INDEX IF NOT EXISTS idx_tweets_v2_keywords_created_ts ON tweets_v2(keywords, created_ts)',
+    'CREATE INDEX IF NOT EXISTS idx_tweets_v2_userid_created_ts ON tweets_v2(userid, created_ts)',
+    'CREATE INDEX IF NOT EXISTS idx_tweet_keywords_keyword ON tweet_keywords(keyword_normalized, tweetID)',
+    'CREATE INDEX IF NOT EXISTS idx_keyword_daily_stats_day ON keyword_daily_stats(day)',
+    'CREATE INDEX IF NOT EXISTS idx_author_daily_stats_day ON author_daily_stats(day)',
+]
+
+# 推文全文索引：外部内容表，数据仍只存一份在 tweets_v2，由触发器保持同步。
+# tweets_v2 的主键是 TEXT，rowid 是隐式的，VACUUM 可能重排 rowid，
+# 之后索引会指向错误的推文；因此不要直接 VACUUM，而是用 vacuum_database()，它会随后重建索引。
+FTS_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts USING fts5(
+        full_text, user_name, screen_name,
+        content='tweets_v2', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+
+FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS tweets_v2_fts_insert AFTER INSERT ON tweets_v2 BEGIN
+        INSERT INTO tweets_fts (rowid, full_text, user_name, screen_name)
+        VALUES (new.rowid, new.full_text, new.user_name, new.screen_name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS tweets_v2_fts_delete AFTER DELETE ON tweets_v2 BEGIN
+        INSERT INTO tweets_fts (tweets_fts, rowid, full_text, user_name, screen_name)
+        VALUES ('delete', old.rowid, old.full_text, old.user_name, old.screen_name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS tweets_v2_fts_update AFTER UPDATE OF full_text, user_name, screen_name ON tweets_v2 BEGIN
+        INSERT INTO tweets_fts (tweets_fts, rowid, full_text, user_name, screen_name)
+        VALUES ('delete', old.rowid, old.full_text, old.user_name, old.screen_name);
+        INSERT INTO tweets_fts (rowid, full_text, user_name, screen_name)
+        VALUES (new.rowid, new.full_text, new.user_name, new.screen_name);
+    END
+    ''',
+]
+
+
+def connect_to_db():
+    return open_connection()
+
+
+def ensure_tweets_v2_schema(cursor):
+    """补齐 tweets_v2 的新增列、派生表和索引，可重复执行"""
+    cursor.execute("PRAGMA table_info(tweets_v2);")
+    existing = {col[1] for col in cursor.fetchall()}
+    for name, col_type in HOT_COLUMNS:
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE tweets_v2 ADD COLUMN {name} {col_type};')
+            print(f"Added column {name} to tweets_v2")
+
+    for table_sql in TABLES:
+        cursor.execute(table_sql)
+
+    for index_sql in INDEXES:
+        cursor.execute(index_sql)
+
+    ensure_data_versions_table(cursor)
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'tweets_fts'")
+    fts_exists = cursor.fetchone() is not None
+    cursor.execute(FTS_TABLE)
+    for trigger_sql in FTS_TRIGGERS:
+        cursor.execute(trigger_sql)
+    if not fts_exists:
+        # 首次创建时根据已有数据建立索引
+        cursor.execute("INSERT INTO tweets_fts (tweets_fts) VALUES ('rebuild')")
+        print("Built tweets_fts index")
+
+
+def backfill_hot_columns(conn, batch_size=1000):
+    """分批从原始 JSON 回填常用字段，每批单独提交
+
+    原始 JSON 可能已移到 tweet_content，两处都会读取。
+    """
+    cursor = conn.cursor()
+    last_rowid = 0
+    total = 0
+
+    while True:
+        cursor.execute('''
+            SELECT rowid, tweetID FROM tweets_v2
+            WHERE rowid > ? AND (created_ts IS NULL OR retweet_count IS NULL)
+            ORDER BY rowid
+            LIMIT ?
+        ''', (last_rowid, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        contents = load_raw_contents(cursor, [tweet_id for _, tweet_id in rows])
+        updates = []
+        for rowid, tweet_id in rows:
+            if tweet_id not in contents:
+                continue
+            try:
+                updates.append(extract_hot_fields(json.loads(contents[tweet_id])) + (rowid,))
+            except (TypeError, ValueError) as e:
+                print(f"Skipping rowid {rowid}: {e}")
+
+        cursor.executemany('''
+            UPDATE tweets_v2
+            SET full_text = ?, screen_name = ?, user_name = ?, favorite_count = ?, created_ts = ?, retweet_count = ?
+            WHERE rowid = ?
+        ''', updates)
+        conn.commit()
+
+        last_rowid = rows[-1][0]
+        total += len(updates)
+        print(f"Backfilled {total} rows (last rowid {last_rowid})")
+
+    return total
+
+
+def backfill_tweet_keywords(conn, batch_size=10000):
+    """把 tweets_v2.keywords 中已有的检索词写入 tweet_keywords，按 rowid 分批提交"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(rowid) FROM tweets_v2')
+    max_rowid = cursor.fetchone()[0] or 0
+    total = 0
+
+    for start in range(0, max_rowid, batch_size):
+        cursor.execute('''
+            INSERT OR IGNORE INTO tweet_keywords (tweetID, keyword_normalized, first_seen)
+            SELECT tweetID, REPLACE(keywords, '•', ' '), COALESCE(created_ts, CAST(strftime('%s', 'now') AS INTEGER))
+            FROM tweets_v2
+            WHERE rowid > ? AND rowid <= ?
+            AND keywords IS NOT NULL AND TRIM(keywords) != ''
+        ''', (start, start + batch_size))
+        total += cursor.rowcount
+        conn.commit()
+
+    print(f"Backfilled {total} tweet_keywords rows")
+    return total
+
+
+def rebuild_keyword_daily_stats(conn):
+    """根据 tweet_keywords 全量重建 keyword_daily_stats"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM keyword_daily_stats')
+    cursor.execute('''
+        INSERT INTO keyword_daily_stats (keyword, day, posts, likes)
+        SELECT k.keyword_normalized, date(t.created_ts, 'unixepoch'),
+               COUNT(*), SUM(COALESCE(t.favorite_count, 0))
+        FROM tweet_keywords k
+        JOIN tweets_v2 t ON t.tweetID = k.tweetID
+        WHERE t.created_ts IS NOT NULL
+        GROUP BY k.keyword_normalized, date(t.created_ts, 'unixepoch')
+    ''')
+    conn.commit()
+    print(f"Rebuilt keyword_daily_stats: {cursor.rowcount} rows")
+
+
+def rebuild_author_daily_stats(conn):
+    """根据 tweets_v2 全量重建 author_daily_stats，screen_name 取当天最新一条推文的"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM author_daily_stats')
+    cursor.execute('''
+        INSERT INTO author_daily_stats (userid, day, screen_name, tweets, likes, retweets)
+        SELECT userid, day, screen_name, tweets, likes, retweets
+        FROM (
+            SELECT userid, date(created_ts, 'unixepoch') AS day,
+                   screen_name, MAX(created_ts),
+                   COUNT(*) AS tweets,
+                   SUM(COALESCE(favorite_count, 0)) AS likes,
+                   SUM(COALESCE(retweet_count, 0)) AS retweets
+            FROM tweets_v2
+            WHERE created_ts IS NOT NULL AND userid IS NOT NULL AND userid != ''
+            GROUP BY userid, date(created_ts, 'unixepoch')
+        )
+    ''')
+    conn.commit()
+    print(f"Rebuilt author_daily_stats: {cursor.rowcount} rows")
+
+
+def move_content(conn, batch_size=1000):
+    """把 tweets_v2.Content 分批压缩写入 tweet_content 并清空原列，每批单独提交，服务可照常读写"""
+    cursor = conn.cursor()
+    last_rowid = 0
+    total = 0
+    raw_bytes = 0
+    compressed_bytes = 0
+
+    while True:
+        cursor.execute('''
+            SELECT rowid, tweetID, Content FROM tweets_v2
+            WHERE rowid > ? AND Content IS NOT NULL
+            ORDER BY rowid
+            LIMIT ?
+        ''', (last_rowid, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        contents = [(tweet_id, compress_content(content)) for _, tweet_id, content in rows]
+        cursor.executemany(INSERT_CONTENT_SQL, contents)
+        cursor.executemany('UPDATE tweets_v2 SET Content = NULL WHERE rowid = ?', [(row[0],) for row in rows])
+        conn.commit()
+
+        last_rowid = rows[-1][0]
+        total += len(rows)
+        raw_bytes += sum(len(row[2].encode('utf-8')) for row in rows)
+        compressed_bytes += sum(len(blob) for _, blob in contents)
+        print(f"Moved {total} rows (last rowid {last_rowid})")
+
+    if total:
+        print(f"Content: {raw_bytes / 1024 / 1024:.1f} MB -> {compressed_bytes / 1024 / 1024:.1f} MB compressed")
+    return total
+
+
+def vacuum_database(conn):
+    """VACUUM 回收 freelist 中的空间，随后重建 tweets_fts
+
+    VACUUM 可能重排 tweets_v2 的隐式 rowid，tweets_fts 按 rowid 关联，必须重建；
+    同时递增 'tweets' 数据版本使响应缓存失效。/get_tweets 的 cursor 同样基于 rowid，
+    客户端需重新获取；应在停服时执行，重启后 SSE 分发位置会重新初始化。
+    """
+    conn.commit()
+    conn.execute('VACUUM')
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO tweets_fts (tweets_fts) VALUES ('rebuild')")
+    bump_data_version(cursor, 'tweets')
+    conn.commit()
+    print("VACUUM done, rebuilt tweets_fts")
+
+
+def storage_report(conn):
+    """数据库占用与 tweets_v2 全表扫描耗时
+
+    释放的页留在 freelist 中；需要缩小文件时用 vacuum_database()，不要直接 VACUUM。
+    """
+    cursor = conn.cursor()
+    page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+    page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+
+    started = time.perf_counter()
+    # SUM 一个常用列，迫使 SQLite 读取 tweets_v2 的每个数据页
+    cursor.execute('SELECT COUNT(*), SUM(favorite_count) FROM tweets_v2 NOT INDEXED')
+    rows = cursor.fetchone()[0]
+    scan_ms = (time.perf_counter() - started) * 1000
+
+    report = {
+        'file_mb': page_count * page_size / 1024 / 1024,
+        'used_mb': (page_count - free_pages) * page_size / 1024 / 1024,
+        'rows': rows,
+        'scan_ms': scan_ms,
+    }
+    print(f"DB file {report['file_mb']:.1f} MB, in use {report['used_mb']:.1f} MB, "
+          f"tweets_v2 scan of {rows} rows: {scan_ms:.1f} ms")
+    return report
+
+
+def main():
+    conn = connect_to_db()
+    cursor = conn.cursor()
+
+    # python migrate_tweets_v2.py rebuild_rollups 只重建汇总表
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild_rollups':
+        ensure_tweets_v2_schema(cursor)
+        conn.commit()
+        rebuild_keyword_daily_stats(conn)
+        rebuild_author_daily_stats(conn)
+        conn.close()
+        return
+
+    # python migrate_tweets_v2.py move_content [batch_size] 把原始 JSON 移到压缩表
+    if len(sys.argv) > 1 and sys.argv[1] == 'move_content':
+        ensure_tweets_v2_schema(cursor)
+        conn.commit()
+        print("迁移前:")
+        storage_report(conn)
+        move_content(conn, int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+        print("迁移后（释放的页在 freelist 中，会被后续写入复用，或用 vacuum 子命令回收）:")
+        storage_report(conn)
+        conn.close()
+        return
+
+    # python migrate_tweets_v2.py vacuum 回收空间并重建全文索引
+    if len(sys.argv) > 1 and sys.argv[1] == 'vacuum':
+        ensure_tweets_v2_schema(cursor)
+        conn.commit()
+        vacuum_database(conn)
+        storage_report(conn)
+        conn.close()
+        return
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    print("开始迁移tweets_v2表...")
+    ensure_tweets_v2_schema(cursor)
+    conn.commit()
+
+    total = backfill_hot_columns(conn, batch_size)
+    print(f"\n回填完成，共处理 {total} 条记录")
+
+    backfill_tweet_keywords(conn)
+    rebuild_keyword_daily_stats(conn)
+    rebuild_author_daily_stats(conn)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
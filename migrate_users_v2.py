@@ -0,0 +1,46 @@
+from create_user_table import USERS_V2_INDEXES, USERS_V2_TABLE_SQL, create_user_snapshot_tables
+from db import ensure_data_versions_table, open_connection
+
+
+def ensure_users_v2_schema(cursor):
+    """补齐 users_v2、快照表及其压缩层和索引，可重复执行"""
+    cursor.execute(USERS_V2_TABLE_SQL)
+    for index_sql in USERS_V2_INDEXES:
+        cursor.execute(index_sql)
+    create_user_snapshot_tables(cursor)
+    ensure_data_versions_table(cursor)
+
+
+def backfill_user_snapshots(conn):
+    """用 users_v2 现有的每一行生成一条快照，时间取 last_updated"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO user_snapshots (
+            user_id, ts, followers_count, friends_count,
+            listed_count, favourites_count, media_count
+        )
+        SELECT user_id, CAST(strftime('%s', last_updated) AS INTEGER),
+               followers_count, friends_count,
+               listed_count, favourites_count, media_count
+        FROM users_v2
+        WHERE last_updated IS NOT NULL
+    ''')
+    count = cursor.rowcount
+    conn.commit()
+    print(f"Backfilled {count} user snapshots")
+    return count
+
+
+def main():
+    conn = open_connection()
+    cursor = conn.cursor()
+
+    print("开始迁移users_v2表...")
+    ensure_users_v2_schema(cursor)
+    conn.commit()
+    backfill_user_snapshots(conn)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import gzip
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from service_log import get_logger
+
+logger = get_logger('raw_archive')
+
+# 单个分段文件的最大字节数（压缩后）与最长写入时间
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+MAX_SEGMENT_AGE = 3600
+
+
+class RawArchive:
+    """原始请求归档：后台线程把请求追加写入压缩分段文件
+
+    每个分段是若干独立 gzip member 拼接而成的 .jsonl.gz 文件，每条记录一个
+    member，内容为一行紧凑 JSON。同名 .idx 文件逐行记录
+    {"ts", "endpoint", "offset", "length"}，可以只解压单条记录。
+    """
+
+    def __init__(self, directory, prefix, max_segment_bytes=MAX_SEGMENT_BYTES,
+                 max_segment_age=MAX_SEGMENT_AGE, max_pending=1000):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._segment = None
+        self._index = None
+        self._segment_path = None
+        self._segment_opened = 0
+        self._offset = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"{self.prefix}-archive", daemon=True)
+                self._thread.start()
+
+    def append(self, endpoint, data):
+        """把一次请求加入归档队列，不阻塞请求线程；队列满时丢弃并返回 False"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.time(), endpoint, data))
+            return True
+        except queue.Full:
+            logger.warning("Archive queue for %s is full, dropping payload from %s", self.prefix, endpoint)
+            return False
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self._segment_path = os.path.join(self.directory, f"{self.prefix}_{timestamp}.jsonl.gz")
+        self._segment = open(self._segment_path, 'ab')
+        self._index = open(self._segment_path + '.idx', 'a', encoding='utf-8')
+        self._segment_opened = time.monotonic()
+        self._offset = self._segment.tell()
+        logger.info("Opened archive segment: %s", self._segment_path)
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = None
+            self._index = None
+
+    def _should_rotate(self):
+        return (self._offset >= self.max_segment_bytes
+                or time.monotonic() - self._segment_opened >= self.max_segment_age)
+
+    def _write(self, ts, endpoint, data):
+        if self._segment is None or self._should_rotate():
+            self._close_segment()
+            self._open_segment()
+
+        line = json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+        member = gzip.compress(line.encode('utf-8'))
+        self._segment.write(member)
+        self._segment.flush()
+
+        self._index.write(json.dumps({
+            'ts': datetime.fromtimestamp(ts, ZoneInfo("UTC")).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'endpoint': endpoint,
+            'offset': self._offset,
+            'length': len(member)
+        }) + '\n')
+        self._index.flush()
+        self._offset += len(member)
+
+    def _run(self):
+        while True:
+            try:
+                ts, endpoint, data = self._queue.get(timeout=self.max_segment_age)
+            except queue.Empty:
+                # 长时间无写入时关闭当前分段，下次写入会新开一个
+                self._close_segment()
+                continue
+            try:
+                self._write(ts, endpoint, data)
+            except Exception as e:
+                logger.exception("Error archiving payload from %s: %s", endpoint, e)
+                self._close_segment()
+
+
+def iter_index(directory, endpoint=None, start=None, end=None):
+    """遍历目录下所有分段索引，可按 endpoint 和时间（'%Y-%m-%d %H:%M:%S' 前缀比较）过滤"""
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.jsonl.gz.idx'):
+            continue
+        segment_path = os.path.join(directory, name[:-len('.idx')])
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if endpoint and entry['endpoint'] != endpoint:
+                    continue
+                if start and entry['ts'] < start:
+                    continue
+                if end and entry['ts'] > end:
+                    continue
+                entry['segment'] = segment_path
+                yield entry
+
+
+def read_record(segment_path, offset, length):
+    """只读取并解压一条归档记录"""
+    with open(segment_path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(gzip.decompress(f.read(length)))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python raw_archive.py <目录> [endpoint] [开始时间] [结束时间]")
+        print("      python raw_archive.py show <分段文件> <offset> <length>")
+        return
+
+    if sys.argv[1] == 'show':
+        record = read_record(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        print(json.dumps(record, indent=2, ensure_ascii=False))
+        return
+
+    args = sys.argv[2:] + [None] * 3
+    for entry in iter_index(sys.argv[1], args[0], args[1], args[2]):
+        print(f"{entry['ts']}  {entry['endpoint']}  {entry['segment']}  {entry['offset']}  {entry['length']}")
+
+
+if __name__ == '__main__':
+    main()
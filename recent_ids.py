@@ -0,0 +1,90 @@
+import sys
+import threading
+from collections import OrderedDict
+
+from service_log import get_logger
+
+logger = get_logger('recent_ids')
+
+MAX_SIZE = 200000
+
+
+class RecentIdFilter:
+    """最近写入过的 tweetID 集合，写入前据此省去已存在推文的 JSON 序列化
+
+    只记录已提交、且 keywords 非空的推文：这类推文再次出现时通常会被跳过。
+    集合不会随删除失效，是否存在仍以写入时查库为准，命中但库中已没有的
+    推文会照常序列化写入。超过 max_size 时淘汰最久未出现的 ID。
+
+    写入过程中先 stage(conn, ids)，提交后 commit(conn) 才真正加入集合，
+    回滚或关闭连接前 discard(conn) 丢弃。
+    """
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._id_bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def __contains__(self, tweet_id):
+        with self._lock:
+            self.lookups += 1
+            if tweet_id in self._ids:
+                self.hits += 1
+                self._ids.move_to_end(tweet_id)
+                return True
+            return False
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_many(self, tweet_ids):
+        with self._lock:
+            for tweet_id in tweet_ids:
+                if tweet_id in self._ids:
+                    self._ids.move_to_end(tweet_id)
+                    continue
+                self._ids[tweet_id] = None
+                self._id_bytes += sys.getsizeof(tweet_id)
+            while len(self._ids) > self.max_size:
+                evicted, _ = self._ids.popitem(last=False)
+                self._id_bytes -= sys.getsizeof(evicted)
+
+    def stage(self, conn, tweet_ids):
+        with self._lock:
+            self._pending.setdefault(conn, []).extend(tweet_ids)
+
+    def commit(self, conn):
+        with self._lock:
+            tweet_ids = self._pending.pop(conn, [])
+        self.add_many(tweet_ids)
+
+    def discard(self, conn):
+        with self._lock:
+            self._pending.pop(conn, None)
+
+    def warm(self, cursor):
+        """启动时用最近写入且 keywords 非空的推文预热"""
+        cursor.execute('''
+            SELECT tweetID FROM tweets_v2
+            WHERE keywords IS NOT NULL AND TRIM(keywords) != ''
+            ORDER BY rowid DESC
+            LIMIT ?
+        ''', (self.max_size,))
+        # 按从旧到新加入，最新的最后被淘汰
+        self.add_many(row[0] for row in reversed(cursor.fetchall()))
+        logger.info("Warmed recent tweet ID filter with %d IDs", len(self._ids))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._ids),
+                'max_size': self.max_size,
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_ratio': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'memory_bytes': sys.getsizeof(self._ids) + self._id_bytes,
+            }
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, current_app, request
+
+from db import get_data_version, get_read_connection
+
+# 结果依赖当前时间的接口（今天、最近 48 小时等），即使数据没变也要定期重算
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 256
+
+# 反向代理可直接复用响应的秒数，过期后带 If-None-Match 回源校验
+DEFAULT_MAX_AGE = 5
+
+
+class ResponseCache:
+    """按 endpoint + 规范化查询参数缓存序列化后的响应，LRU 淘汰
+
+    每个条目记录生成时的数据版本和时间，版本变化或超过 ttl 即视为失效。
+    cached_response 传入的版本为 (数据版本, 时间段)，时间段切换时条目同样失效。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry_version, created, payload = entry
+            if entry_version != version or time.monotonic() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key, version, payload):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def cache_key():
+    """endpoint 加排序后的查询参数，参数顺序不同视为同一请求"""
+    args = sorted((key, value) for key in request.args for value in request.args.getlist(key))
+    return (request.path, tuple(args))
+
+
+def make_etag(scope, version, bucket, key):
+    """由数据版本、时间段和请求参数得出强 ETag，各进程结果一致"""
+    digest = hashlib.sha1(repr((scope, version, bucket, key)).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def set_validators(response, etag, last_modified, max_age):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+
+def cached_response(cache, scope, max_age=DEFAULT_MAX_AGE):
+    """缓存 GET 接口的 200 响应，命中时直接返回保存的字节
+
+    同时设置 ETag / Last-Modified / Cache-Control。ETag 由数据版本和当前时间段（长度为
+    cache.ttl）决定，If-None-Match 命中时直接返回 304，不执行接口查询也不序列化。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            stamp = get_data_version(get_read_connection().cursor(), scope)
+            if stamp is None:
+                return view(*args, **kwargs)
+
+            version, updated_at = stamp
+            bucket = int(time.time() // cache.ttl)
+            key = cache_key()
+            etag = make_etag(scope, version, bucket, key)
+            last_modified = datetime.fromtimestamp(max(updated_at, bucket * cache.ttl), timezone.utc)
+
+            if request.if_none_match.contains(etag):
+                return set_validators(Response(status=304), etag, last_modified, max_age)
+
+            payload = cache.get(key, (version, bucket))
+            if payload is not None:
+                body, mimetype = payload
+                response = Response(body, status=200, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return set_validators(response, etag, last_modified, max_age)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if not response.is_streamed:
+                cache.put(key, (version, bucket), (response.get_data(), response.mimetype))
+            response.headers['X-Cache'] = 'MISS'
+            return set_validators(response, etag, last_modified, max_age)
+        return wrapper
+    return decorator
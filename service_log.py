@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+# 通过环境变量控制日志级别和请求体采样比例（仅 DEBUG 级别下生效）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '1.0'))
+
+_configured = False
+
+
+def get_logger(name):
+    """各服务共用的 logger，首次调用时配置根 logger"""
+    global _configured
+    if not _configured:
+        logging.basicConfig(
+            level=getattr(logging, LOG_LEVEL, logging.INFO),
+            format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+        )
+        _configured = True
+    return logging.getLogger(name)
+
+
+def log_payload(logger, label, data):
+    """只在 DEBUG 级别且命中采样时才格式化并输出完整请求体"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    logger.debug("%s:\n%s", label, json.dumps(data, indent=2, ensure_ascii=False))
+
+
+class RequestTimer:
+    """记录一次请求各阶段耗时，结束时输出一行汇总日志
+
+    用法:
+        timer = RequestTimer(logger, 'add_all_tweets')
+        with timer.stage('db'):
+            ...
+        timer.summary(status=200, inserted=10)
+    """
+
+    def __init__(self, logger, endpoint):
+        self.logger = logger
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        stage_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - stage_started) * 1000
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def summary(self, **fields):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        parts = [f"endpoint={self.endpoint}"]
+        parts.extend(f"{key}={value}" for key, value in fields.items())
+        parts.append(f"total_ms={total_ms:.1f}")
+        parts.extend(f"{name}_ms={elapsed:.1f}" for name, elapsed in self.stages.items())
+        self.logger.info(' '.join(parts))
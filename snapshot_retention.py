@@ -0,0 +1,166 @@
+import sys
+import time
+
+from db import bump_data_version, open_connection
+from migrate_users_v2 import ensure_users_v2_schema
+from service_log import get_logger
+
+logger = get_logger('snapshot_retention')
+
+# 原始快照保留天数，之后压缩为小时；小时数据保留天数，之后压缩为天
+RAW_RETENTION_DAYS = 7
+HOURLY_RETENTION_DAYS = 90
+
+HOUR = 3600
+DAY = 86400
+
+# 每个事务处理的源行数，保证写锁只持有很短时间
+BATCH_SIZE = 5000
+
+# 每批之间让出写锁的时间（秒）
+BATCH_PAUSE = 0.05
+
+# 压缩层的行：(user_id, ts, samples, followers_min, followers_max, followers_sum, last_ts,
+#              followers_count, friends_count, listed_count, favourites_count, media_count)
+# 原始快照按同样的结构读出，相当于只含一条样本的时段
+SOURCES = {
+    'user_snapshots': ('ts', '''
+        SELECT user_id, ts,
+               CASE WHEN followers_count IS NULL THEN 0 ELSE 1 END,
+               followers_count, followers_count, COALESCE(followers_count, 0), ts,
+               followers_count, friends_count, listed_count, favourites_count, media_count
+        FROM user_snapshots
+    '''),
+    'user_snapshots_hourly': ('bucket', '''
+        SELECT user_id, bucket, samples, followers_min, followers_max, followers_sum, last_ts,
+               followers_count, friends_count, listed_count, favourites_count, media_count
+        FROM user_snapshots_hourly
+    '''),
+}
+
+# 合并进已有时段：min/max/sum/samples 累计，计数列取时间更晚的一方
+UPSERT_BUCKET_SQL = '''
+    INSERT INTO {table} (
+        user_id, bucket, samples, followers_min, followers_max, followers_sum, last_ts,
+        followers_count, friends_count, listed_count, favourites_count, media_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, bucket) DO UPDATE SET
+        samples = samples + excluded.samples,
+        followers_min = MIN(COALESCE(followers_min, excluded.followers_min),
+                            COALESCE(excluded.followers_min, followers_min)),
+        followers_max = MAX(COALESCE(followers_max, excluded.followers_max),
+                            COALESCE(excluded.followers_max, followers_max)),
+        followers_sum = followers_sum + excluded.followers_sum,
+        last_ts = MAX(last_ts, excluded.last_ts),
+        followers_count = CASE WHEN excluded.last_ts > last_ts THEN excluded.followers_count ELSE followers_count END,
+        friends_count = CASE WHEN excluded.last_ts > last_ts THEN excluded.friends_count ELSE friends_count END,
+        listed_count = CASE WHEN excluded.last_ts > last_ts THEN excluded.listed_count ELSE listed_count END,
+        favourites_count = CASE WHEN excluded.last_ts > last_ts THEN excluded.favourites_count ELSE favourites_count END,
+        media_count = CASE WHEN excluded.last_ts > last_ts THEN excluded.media_count ELSE media_count END
+'''
+
+
+def _min_ignore_none(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max_ignore_none(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def merge_buckets(rows, bucket_seconds):
+    """把同一用户、同一时段内的行（已按 user_id, ts 排序）合并成一行"""
+    buckets = {}
+    for row in rows:
+        key = (row[0], row[1] // bucket_seconds * bucket_seconds)
+        merged = buckets.get(key)
+        if merged is None:
+            buckets[key] = key + row[2:]
+            continue
+        buckets[key] = key + (
+            merged[2] + row[2],
+            _min_ignore_none(merged[3], row[3]),
+            _max_ignore_none(merged[4], row[4]),
+            merged[5] + row[5],
+        ) + (row[6:] if row[6] > merged[6] else merged[6:])
+    return list(buckets.values())
+
+
+def compact(conn, source, target, cutoff, bucket_seconds, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """把 source 中时间早于 cutoff 的行按 bucket_seconds 合并进 target 并删除，每批一个事务
+
+    cutoff 需对齐到 bucket_seconds，保证被压缩的时段都是完整的。返回处理的源行数。
+    """
+    ts_column, select_sql = SOURCES[source]
+    cursor = conn.cursor()
+    last_key = (-1, -1)
+    total = 0
+
+    while True:
+        # 写锁在读取前拿到，读出的行在提交前不会被其他连接改动
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute(f'''
+                {select_sql}
+                WHERE (user_id, {ts_column}) > (?, ?) AND {ts_column} < ?
+                ORDER BY user_id, {ts_column}
+                LIMIT ?
+            ''', last_key + (cutoff, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                conn.rollback()
+                break
+
+            cursor.executemany(UPSERT_BUCKET_SQL.format(table=target), merge_buckets(rows, bucket_seconds))
+            cursor.execute(f'''
+                DELETE FROM {source}
+                WHERE (user_id, {ts_column}) > (?, ?) AND (user_id, {ts_column}) <= (?, ?)
+                AND {ts_column} < ?
+            ''', last_key + (rows[-1][0], rows[-1][1], cutoff))
+            bump_data_version(cursor, 'users')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        last_key = (rows[-1][0], rows[-1][1])
+        total += len(rows)
+        logger.info("Compacted %d rows from %s into %s", total, source, target)
+        if pause:
+            time.sleep(pause)
+
+    return total
+
+
+def run_retention(conn, raw_days=RAW_RETENTION_DAYS, hourly_days=HOURLY_RETENTION_DAYS, now=None):
+    """原始快照超过 raw_days 天的压缩为小时，小时数据超过 hourly_days 天的压缩为天
+
+    各层按时间互不重叠是读接口的前提，因此 hourly_days 不能小于 raw_days。
+    """
+    if hourly_days < raw_days:
+        raise ValueError("hourly_days must not be less than raw_days")
+    now = int(now if now is not None else time.time())
+    hourly_cutoff = (now - raw_days * DAY) // HOUR * HOUR
+    daily_cutoff = (now - hourly_days * DAY) // DAY * DAY
+
+    raw = compact(conn, 'user_snapshots', 'user_snapshots_hourly', hourly_cutoff, HOUR)
+    hourly = compact(conn, 'user_snapshots_hourly', 'user_snapshots_daily', daily_cutoff, DAY)
+    logger.info("Snapshot retention done: %d raw rows -> hourly, %d hourly rows -> daily", raw, hourly)
+    return raw, hourly
+
+
+def main():
+    # python snapshot_retention.py [raw_days] [hourly_days]，可由 cron 定时执行
+    raw_days = int(sys.argv[1]) if len(sys.argv) > 1 else RAW_RETENTION_DAYS
+    hourly_days = int(sys.argv[2]) if len(sys.argv) > 2 else HOURLY_RETENTION_DAYS
+
+    conn = open_connection()
+    ensure_users_v2_schema(conn.cursor())
+    conn.commit()
+    raw, hourly = run_retention(conn, raw_days, hourly_days)
+    print(f"Compacted {raw} raw snapshots into hourly buckets and {hourly} hourly buckets into daily buckets")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
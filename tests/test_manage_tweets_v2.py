@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from bench.payloads import PayloadGenerator
+from bench.seed import BASE_TWEETS_V2_SQL
+from db import get_data_version
+from manage_tweets_v2 import DERIVED_TABLES, clear_tweets_v2_table
+from migrate_tweets_v2 import ensure_tweets_v2_schema
+from tweet_ingest import ingest_payload
+
+
+def count_rows(cursor, table):
+    cursor.execute(f'SELECT COUNT(*) FROM {table}')
+    return cursor.fetchone()[0]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'tweets.db'))
+    cursor = conn.cursor()
+    cursor.execute(BASE_TWEETS_V2_SQL)
+    ensure_tweets_v2_schema(cursor)
+    conn.commit()
+
+    payload = PayloadGenerator(seed=1).tweets_payload(items=2, tweets_per_item=10, dup_ratio=0)
+    ingest_payload(cursor, payload['output'], payload['rune_names'])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_clear_removes_derived_rows_and_bumps_version(conn):
+    cursor = conn.cursor()
+    for table in ['tweets_v2'] + DERIVED_TABLES:
+        assert count_rows(cursor, table) > 0
+    version_before = get_data_version(cursor, 'tweets')[0]
+
+    assert clear_tweets_v2_table(cursor)
+    conn.commit()
+
+    for table in ['tweets_v2', 'tweets_fts'] + DERIVED_TABLES:
+        assert count_rows(cursor, table) == 0
+    assert get_data_version(cursor, 'tweets')[0] == version_before + 1
+
+
+def test_clear_rolls_back_on_error(conn):
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE author_daily_stats')
+    conn.commit()
+    tweets_before = count_rows(cursor, 'tweets_v2')
+
+    assert not clear_tweets_v2_table(cursor)
+    conn.commit()
+
+    assert count_rows(cursor, 'tweets_v2') == tweets_before
+    assert count_rows(cursor, 'tweet_keywords') > 0
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from bench.payloads import PayloadGenerator
+from bench.seed import BASE_TWEETS_V2_SQL
+from migrate_tweets_v2 import ensure_tweets_v2_schema, rebuild_keyword_daily_stats
+from tweet_ingest import ingest_payload
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'tweets.db'))
+    cursor = conn.cursor()
+    cursor.execute(BASE_TWEETS_V2_SQL)
+    ensure_tweets_v2_schema(cursor)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def keyword_daily_stats(cursor):
+    cursor.execute('SELECT keyword, day, posts, likes FROM keyword_daily_stats ORDER BY keyword, day')
+    return cursor.fetchall()
+
+
+def test_keyword_rollup_matches_rebuild_when_likes_change(conn):
+    cursor = conn.cursor()
+    generator = PayloadGenerator(seed=1)
+    tweets = [generator.tweet(tweet_id) for tweet_id in range(1, 6)]
+    for tweet in tweets:
+        tweet['favorite_count'] = 10
+
+    ingest_payload(cursor, [{'data': {'freeBusy': {'post': tweets}}}], ['FIRST•KEYWORD'])
+    conn.commit()
+
+    # 同一批推文在新的检索词下再次出现，点赞数已经变了
+    for tweet in tweets:
+        tweet['favorite_count'] = 99
+    ingest_payload(cursor, [{'data': {'freeBusy': {'post': tweets}}}], ['SECOND•KEYWORD'])
+    conn.commit()
+
+    incremental = keyword_daily_stats(cursor)
+    assert sum(likes for _, _, _, likes in incremental) == 2 * 5 * 10
+    rebuild_keyword_daily_stats(conn)
+    assert keyword_daily_stats(cursor) == incremental
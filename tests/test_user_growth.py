@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from migrate_users_v2 import ensure_users_v2_schema
+from user_v2 import growth_per_day, query_follower_growth
+
+NOW = 1800000000
+DAY = 86400
+
+
+def add_user(cursor, user_id, snapshots):
+    """snapshots 为 [(距 NOW 的秒数, 粉丝数), ...]，最后一条同时作为 users_v2 的最新状态"""
+    last_ago, latest = snapshots[-1]
+    cursor.execute(
+        "INSERT INTO users_v2 (user_id, screen_name, followers_count, last_updated) "
+        "VALUES (?, ?, ?, datetime(?, 'unixepoch'))",
+        (user_id, f'user_{user_id}', latest, NOW - last_ago)
+    )
+    cursor.executemany(
+        'INSERT INTO user_snapshots (user_id, ts, followers_count) VALUES (?, ?, ?)',
+        [(user_id, NOW - ago, followers) for ago, followers in snapshots]
+    )
+
+
+@pytest.fixture
+def cursor(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'users.db'))
+    cursor = conn.cursor()
+    ensure_users_v2_schema(cursor)
+    # 跟踪了 5 天，稳定增长
+    add_user(cursor, 1, [(5 * DAY, 1000), (0, 1500)])
+    # 第一次快照只在 1 秒前
+    add_user(cursor, 2, [(1, 1000), (0, 2000)])
+    conn.commit()
+    yield cursor
+    conn.close()
+
+
+def test_per_day_ignores_baselines_seconds_old(cursor):
+    rows = query_follower_growth(cursor, [('7d', 7)], NOW, 'per_day', '7d')
+
+    assert [row[0] for row in rows] == [1, 2]
+    user_id, _, latest_ts, latest, change, since = rows[0]
+    assert growth_per_day(change, latest_ts, since, 7) == pytest.approx(100.0)
+    _, _, latest_ts, latest, change, since = rows[1]
+    assert change == 1000
+    assert growth_per_day(change, latest_ts, since, 7) is None
+
+
+def test_change_still_reported_for_short_baselines(cursor):
+    rows = query_follower_growth(cursor, [('7d', 7)], NOW, 'change', '7d')
+
+    assert [(row[0], row[4]) for row in rows] == [(2, 1000), (1, 500)]
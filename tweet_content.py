@@ -0,0 +1,54 @@
+import json
+import zlib
+
+# 原始推文 JSON 单独压缩存放在 tweet_content，tweets_v2 只保留常用列；
+# 迁移完成前的旧行仍在 tweets_v2.Content 中，读取时两处都会查
+CONTENT_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS tweet_content (
+        tweetID TEXT PRIMARY KEY,
+        content BLOB NOT NULL  -- zlib 压缩的 UTF-8 JSON
+    )
+'''
+
+INSERT_CONTENT_SQL = 'INSERT OR IGNORE INTO tweet_content (tweetID, content) VALUES (?, ?)'
+
+COMPRESS_LEVEL = 6
+
+# IN (...) 查询每次最多的参数个数
+LOOKUP_CHUNK = 500
+
+
+def compress_content(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESS_LEVEL)
+
+
+def decompress_content(blob):
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def load_raw_contents(cursor, tweet_ids):
+    """按 tweetID 读取原始推文 JSON 字符串，返回 {tweetID: json}，找不到的不出现在结果中"""
+    contents = {}
+    tweet_ids = list(tweet_ids)
+    for start in range(0, len(tweet_ids), LOOKUP_CHUNK):
+        chunk = tweet_ids[start:start + LOOKUP_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT tweetID, content FROM tweet_content WHERE tweetID IN ({placeholders})', chunk)
+        for tweet_id, blob in cursor.fetchall():
+            contents[tweet_id] = decompress_content(blob)
+
+        # 尚未迁移的旧行
+        missing = [tweet_id for tweet_id in chunk if tweet_id not in contents]
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            cursor.execute(
+                f'SELECT tweetID, Content FROM tweets_v2 WHERE tweetID IN ({placeholders}) AND Content IS NOT NULL',
+                missing
+            )
+            contents.update(cursor.fetchall())
+    return contents
+
+
+def load_raw_tweets(cursor, tweet_ids):
+    """同 load_raw_contents，但返回解析后的 dict"""
+    return {tweet_id: json.loads(content) for tweet_id, content in load_raw_contents(cursor, tweet_ids).items()}
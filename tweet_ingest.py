@@ -0,0 +1,332 @@
+import json
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from db import bump_data_version
+from service_log import get_logger
+from tweet_content import INSERT_CONTENT_SQL, compress_content
+from twitter_time import twitter_time_to_epoch
+
+logger = get_logger('tweet_ingest')
+
+# 每批写入的行数，同时也是 IN (...) 查询的参数个数上限
+CHUNK_SIZE = 500
+
+# 推文不存在则插入；已存在且 keywords 为空时才补写 keywords。
+# 原始 JSON（?2）不写入 tweets_v2，而是压缩后写入 tweet_content
+UPSERT_TWEET_SQL = '''
+    INSERT INTO tweets_v2 (
+        tweetID, Content, CreatedAt, userid, keywords,
+        full_text, screen_name, user_name, favorite_count, created_ts, retweet_count
+    ) VALUES (?1, NULL, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11)
+    ON CONFLICT(tweetID) DO UPDATE SET keywords = excluded.keywords
+    WHERE tweets_v2.keywords IS NULL OR TRIM(tweets_v2.keywords) = ''
+'''
+
+# 推文与检索词的多对多关系，同一对只记录第一次出现的时间
+INSERT_KEYWORD_LINK_SQL = '''
+    INSERT OR IGNORE INTO tweet_keywords (tweetID, keyword_normalized, first_seen)
+    VALUES (?, ?, ?)
+'''
+
+# 检索词按天汇总，只对新出现的 (推文, 检索词) 关联累加
+UPSERT_KEYWORD_DAILY_SQL = '''
+    INSERT INTO keyword_daily_stats (keyword, day, posts, likes)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(keyword, day) DO UPDATE SET
+        posts = posts + excluded.posts,
+        likes = likes + excluded.likes
+'''
+
+# 作者按天汇总，只对新插入的推文累加；screen_name 保留最近一次见到的
+UPSERT_AUTHOR_DAILY_SQL = '''
+    INSERT INTO author_daily_stats (userid, day, screen_name, tweets, likes, retweets)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(userid, day) DO UPDATE SET
+        screen_name = COALESCE(excluded.screen_name, screen_name),
+        tweets = tweets + excluded.tweets,
+        likes = likes + excluded.likes,
+        retweets = retweets + excluded.retweets
+'''
+
+
+def extract_hot_fields(tweet):
+    """提取读接口常用的字段
+
+    返回 (full_text, screen_name, user_name, favorite_count, created_ts, retweet_count)，
+    与 tweets_v2 中同名列一一对应。
+    """
+    user = tweet.get('user') or {}
+    return (
+        tweet.get('full_text', ''),
+        user.get('screen_name'),
+        user.get('name'),
+        _int_or_zero(tweet.get('favorite_count')),
+        twitter_time_to_epoch(tweet.get('created_at')),
+        _int_or_zero(tweet.get('retweet_count'))
+    )
+
+
+def _int_or_zero(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def normalize_keyword(keyword):
+    """标准化关键词：将 • 替换为空格"""
+    if keyword:
+        return keyword.replace('•', ' ')
+    return keyword
+
+
+def _is_empty_keywords(keywords):
+    return keywords is None or keywords.strip() == ''
+
+
+def collect_tweet_rows(output_list, rune_names, recent_ids=None):
+    """把 Coze 返回的 output 与 rune_names 展开成待写入的行元组
+
+    返回 (rows, error_tweets, unserialized)，rows 中每个元素为
+    (tweetID, Content, CreatedAt, userid, keywords,
+     full_text, screen_name, user_name, favorite_count, created_ts, retweet_count)。
+    已在 recent_ids 中的推文先不序列化，Content 为 None，原始推文放在
+    unserialized 中，写入时发现库中已没有这条推文再序列化。
+    """
+    rows = []
+    error_tweets = []
+    unserialized = {}
+
+    for item_index, (item, keyword) in enumerate(zip(output_list, rune_names)):
+        try:
+            free_busy = item.get('data', {}).get('freeBusy')
+
+            if free_busy is None:
+                logger.debug("Item %d: freeBusy is None, skipping", item_index + 1)
+                continue
+
+            tweets = free_busy.get('post', [])
+            if not tweets:
+                logger.debug("Item %d: No tweets found", item_index + 1)
+                continue
+
+            logger.debug("Found %d tweets in item %d, keyword: %s", len(tweets), item_index + 1, keyword)
+
+            for tweet_index, tweet in enumerate(tweets):
+                tweet_id = None
+                try:
+                    tweet_id = tweet.get('rest_id')
+                    if not tweet_id:
+                        raise ValueError("Missing tweet ID")
+
+                    if recent_ids is not None and tweet_id in recent_ids:
+                        content = None
+                        unserialized[tweet_id] = tweet
+                    else:
+                        content = json.dumps(tweet)
+                    rows.append((
+                        tweet_id,
+                        content,
+                        tweet.get('created_at'),
+                        str(tweet.get('user', {}).get('rest_id', '')),
+                        keyword
+                    ) + extract_hot_fields(tweet))
+                except Exception as e:
+                    logger.warning("Error processing tweet %d in item %d: %s", tweet_index + 1, item_index + 1, e)
+                    error_tweets.append(tweet_id if tweet_id else "Unknown ID")
+
+        except Exception as e:
+            logger.warning("Error processing item %d: %s", item_index + 1, e)
+
+    return rows, error_tweets, unserialized
+
+
+def _fetch_existing_keywords(cursor, tweet_ids):
+    """一次查询取回一批推文当前的 keywords"""
+    placeholders = ','.join('?' * len(tweet_ids))
+    cursor.execute(
+        f'SELECT tweetID, keywords FROM tweets_v2 WHERE tweetID IN ({placeholders})',
+        tweet_ids
+    )
+    return dict(cursor.fetchall())
+
+
+def epoch_to_day(created_ts):
+    """UTC 秒级时间戳对应的日期字符串，keyword_daily_stats.day 使用这个格式"""
+    return datetime.fromtimestamp(created_ts, timezone.utc).strftime('%Y-%m-%d')
+
+
+def _new_keyword_links(cursor, rows, first_seen):
+    """找出这批行中尚未记录的 (推文, 检索词) 关联，并汇总出对应的按天增量
+
+    需在写入 tweets_v2 之后调用：点赞数和时间取库中已存的值而不是这次请求里的，
+    与 rebuild_keyword_daily_stats 的结果一致。
+    """
+    candidates = [(row, normalize_keyword(row[4])) for row in rows if not _is_empty_keywords(row[4])]
+    if not candidates:
+        return [], []
+
+    tweet_ids = list({row[0] for row, _ in candidates})
+    placeholders = ','.join('?' * len(tweet_ids))
+    cursor.execute(
+        f'SELECT tweetID, keyword_normalized FROM tweet_keywords WHERE tweetID IN ({placeholders})',
+        tweet_ids
+    )
+    existing = set(cursor.fetchall())
+
+    links = []
+    for row, keyword in candidates:
+        pair = (row[0], keyword)
+        if pair in existing:
+            continue
+        existing.add(pair)
+        links.append((row[0], keyword, first_seen))
+    if not links:
+        return [], []
+
+    link_ids = list({tweet_id for tweet_id, _, _ in links})
+    placeholders = ','.join('?' * len(link_ids))
+    cursor.execute(
+        f'SELECT tweetID, favorite_count, created_ts FROM tweets_v2 WHERE tweetID IN ({placeholders})',
+        link_ids
+    )
+    stored = {tweet_id: (favorite_count, created_ts) for tweet_id, favorite_count, created_ts in cursor.fetchall()}
+
+    daily = {}
+    for tweet_id, keyword, _ in links:
+        favorite_count, created_ts = stored.get(tweet_id, (None, None))
+        if created_ts is None:
+            continue
+        key = (keyword, epoch_to_day(created_ts))
+        posts, likes = daily.get(key, (0, 0))
+        daily[key] = (posts + 1, likes + (favorite_count or 0))
+
+    rollup = [(keyword, day, posts, likes) for (keyword, day), (posts, likes) in daily.items()]
+    return links, rollup
+
+
+def _author_daily_rollup(rows):
+    """汇总新插入推文按 (作者, 天) 的推文数、点赞数和转推数"""
+    daily = {}
+    for row in rows:
+        userid, screen_name, favorite_count, created_ts, retweet_count = row[3], row[6], row[8], row[9], row[10]
+        if not userid or created_ts is None:
+            continue
+        key = (userid, epoch_to_day(created_ts))
+        _, tweets, likes, retweets = daily.get(key, (None, 0, 0, 0))
+        daily[key] = (screen_name, tweets + 1, likes + (favorite_count or 0), retweets + (retweet_count or 0))
+    return [key + value for key, value in daily.items()]
+
+
+def write_tweet_rows(cursor, rows, unserialized=None, chunk_size=CHUNK_SIZE):
+    """按批写入推文行，不提交事务，由调用方决定何时 commit
+
+    返回 (inserted_tweets, skipped_tweets, error_tweets, settled_ids)，语义与逐条写入时一致：
+    同一批次内重复出现的推文按出现顺序处理。已存在的推文在新的检索词下
+    出现时，仍会在 tweet_keywords 中补上这条关联，并累加到 keyword_daily_stats。
+    新插入推文的原始 JSON 压缩后写入 tweet_content，并累加到 author_daily_stats。
+    Content 为 None 的行是 RecentIdFilter 认为已存在的推文，仍以查库结果为准：
+    库中存在且 keywords 非空时不写 tweets_v2，否则用 unserialized 中的原始推文补上 Content 照常写入。
+    settled_ids 为写入后 keywords 非空的推文，可以加入 RecentIdFilter。
+    """
+    first_seen = int(time.time())
+    inserted_tweets = []
+    skipped_tweets = []
+    error_tweets = []
+    settled_ids = []
+
+    # 先显式开启事务，否则 RELEASE 最外层 SAVEPOINT 会直接提交
+    if not cursor.connection.in_transaction:
+        cursor.execute('BEGIN')
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        known = _fetch_existing_keywords(cursor, list({row[0] for row in chunk}))
+        # 表被清空或行被删除后集合里的 ID 可能已不在库中，这时仍需序列化写入
+        chunk = [
+            (row[0], json.dumps(unserialized[row[0]])) + row[2:]
+            if row[1] is None and _is_empty_keywords(known.get(row[0])) else row
+            for row in chunk
+        ]
+        fresh = [row for row in chunk if row[1] is not None]
+
+        outcomes = []
+        for row in chunk:
+            tweet_id, keyword = row[0], row[4]
+            if row[1] is None:
+                outcomes.append((skipped_tweets, tweet_id))
+            elif tweet_id not in known:
+                outcomes.append((inserted_tweets, tweet_id))
+                known[tweet_id] = keyword
+            elif _is_empty_keywords(known[tweet_id]):
+                outcomes.append((skipped_tweets, f"{tweet_id} (keywords updated)"))
+                known[tweet_id] = keyword
+            else:
+                outcomes.append((skipped_tweets, tweet_id))
+
+        cursor.execute('SAVEPOINT tweet_chunk')
+        try:
+            cursor.executemany(UPSERT_TWEET_SQL, fresh)
+            cursor.execute('RELEASE SAVEPOINT tweet_chunk')
+        except sqlite3.Error as e:
+            # 整批失败时回滚这一批，再逐条写入以定位出错的推文
+            logger.warning("Batch write failed (%s), retrying %d rows one by one", e, len(fresh))
+            cursor.execute('ROLLBACK TO SAVEPOINT tweet_chunk')
+            cursor.execute('RELEASE SAVEPOINT tweet_chunk')
+            for row_index, row in enumerate(chunk):
+                if row[1] is None:
+                    continue
+                try:
+                    cursor.execute(UPSERT_TWEET_SQL, row)
+                except sqlite3.Error as row_error:
+                    logger.warning("Error writing tweet %s: %s", row[0], row_error)
+                    outcomes[row_index] = (error_tweets, row[0])
+
+        inserted_rows = [row for row, (target, _) in zip(chunk, outcomes) if target is inserted_tweets]
+        cursor.executemany(INSERT_CONTENT_SQL, [(row[0], compress_content(row[1])) for row in inserted_rows])
+        cursor.executemany(UPSERT_AUTHOR_DAILY_SQL, _author_daily_rollup(inserted_rows))
+
+        written = [row for row, (target, _) in zip(chunk, outcomes) if target is not error_tweets]
+        links, rollup = _new_keyword_links(cursor, written, first_seen)
+        cursor.executemany(INSERT_KEYWORD_LINK_SQL, links)
+        cursor.executemany(UPSERT_KEYWORD_DAILY_SQL, rollup)
+
+        for row, (target, value) in zip(chunk, outcomes):
+            target.append(value)
+            if target is not error_tweets and (row[1] is None or not _is_empty_keywords(known.get(row[0]))):
+                settled_ids.append(row[0])
+
+    return inserted_tweets, skipped_tweets, error_tweets, settled_ids
+
+
+def ingest_payload(cursor, output_list, rune_names, recent_ids=None):
+    """解析并写入一次 /add_all_tweets 请求，返回与接口响应一致的结果字典（不提交）
+
+    传入 recent_ids 时用它省去已知推文的序列化，并把本次确认的推文 stage 到当前连接，
+    调用方提交后需调用 recent_ids.commit(conn)。
+    """
+    rows, error_tweets, unserialized = collect_tweet_rows(output_list, rune_names, recent_ids)
+    logger.debug("Collected %d tweets from %d items", len(rows), len(output_list))
+
+    changes_before = cursor.connection.total_changes
+    inserted_tweets, skipped_tweets, write_errors, settled_ids = write_tweet_rows(cursor, rows, unserialized)
+    error_tweets.extend(write_errors)
+
+    if recent_ids is not None:
+        recent_ids.stage(cursor.connection, settled_ids)
+
+    # 有实际写入时才更新数据版本，读接口的缓存据此失效
+    if cursor.connection.total_changes != changes_before:
+        bump_data_version(cursor, 'tweets')
+
+    return {
+        "inserted": inserted_tweets,
+        "skipped": skipped_tweets,
+        "errors": error_tweets,
+        "total_processed": len(inserted_tweets) + len(skipped_tweets) + len(error_tweets),
+        "total_inserted": len(inserted_tweets),
+        "total_skipped": len(skipped_tweets),
+        "total_errors": len(error_tweets)
+    }
@@ -0,0 +1,121 @@
+from html import escape
+
+# /get_tweets_formated 页面模板，模块加载时拼好，渲染时只做替换和 format
+PAGE_HEAD = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>最新热门推文</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            max-width: 800px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        h1 {
+            color: #1da1f2;
+            text-align: center;
+        }
+        .tweet {
+            background-color: #f8f9fa;
+            border: 1px solid #e1e8ed;
+            border-radius: 10px;
+            padding: 15px;
+            margin-bottom: 20px;
+        }
+        .tweet-text {
+            font-size: 16px;
+            margin-bottom: 10px;
+        }
+        .tweet-title {
+            font-size: 18px;
+            font-weight: bold;
+            margin-bottom: 10px;
+        }
+        .tweet-info {
+            font-size: 14px;
+            color: #657786;
+        }
+        .tweet-link {
+            color: #1da1f2;
+            text-decoration: none;
+        }
+        .tweet-link:hover {
+            text-decoration: underline;
+        }
+    </style>
+</head>
+<body>
+    <h1>🔥 最新热门推文 🔥</h1>
+    <p>更新时间: {updated_at} 北京时间</p>
+"""
+
+PAGE_FOOT = """</body>
+</html>
+"""
+
+INFO_LINE = "    <p>{}</p>\n".format
+
+# tweets_v2 推文
+TWEET_V2_ROW = """    <div class="tweet">
+        <div class="tweet-text">{text}</div>
+        <div class="tweet-info">
+            <p>👤 作者: {name} @{screen_name}</p>
+            <p>🕒 时间: {created_at}</p>
+            <p>🔍 检索词: {keywords}</p>
+            <p>🔗 链接: <a href="{link}" target="_blank" class="tweet-link">{link}</a></p>
+            <p>🌟 影响力: {influence}</p>
+        </div>
+    </div>
+""".format
+
+# 旧版 tweets 表
+LEGACY_TWEET_ROW = """    <div class="tweet">
+        <div class="tweet-title">{title}</div>
+        <div class="tweet-info">
+            <p>👤 作者: {author} @{username}</p>
+            <p>🕒 时间: {created_at}</p>
+            <p>🔗 链接: <a href="{link}" target="_blank" class="tweet-link">{link}</a></p>
+            <p>📊 类型: {tweet_type}</p>
+            <p>💯 评分: {score}</p>
+            <p>🌟 影响力: {influence}</p>
+        </div>
+    </div>
+""".format
+
+# 每渲染这么多条推文输出一次
+STREAM_BATCH = 50
+
+
+def unescape_text(text):
+    """还原文本中的 \\uXXXX、\\n 等转义；不含反斜杠时直接返回，非 ASCII 字符保持不变"""
+    if not text:
+        return ''
+    if '\\' not in text:
+        return text
+    try:
+        return text.encode('latin-1', 'backslashreplace').decode('unicode_escape')
+    except UnicodeDecodeError:
+        return text
+
+
+def page_head(updated_at, *info_lines):
+    return PAGE_HEAD.replace('{updated_at}', escape(updated_at)) + ''.join(INFO_LINE(escape(line)) for line in info_lines)
+
+
+def render_page(head, rows, render_row, batch=STREAM_BATCH):
+    """逐批生成页面片段，可直接作为 Response 的生成器，也可 ''.join 得到完整页面"""
+    yield head
+    chunk = []
+    for row in rows:
+        chunk.append(render_row(row))
+        if len(chunk) >= batch:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+    yield PAGE_FOOT
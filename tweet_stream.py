@@ -0,0 +1,228 @@
+import json
+import queue
+import threading
+
+from db import get_data_version, get_read_connection, open_connection
+from kol_registry import influence_level
+from service_log import get_logger
+from tweet_ingest import normalize_keyword
+
+logger = get_logger('tweet_stream')
+
+# 每个订阅者最多缓存的事件数，超出后改为从数据库补齐
+MAX_BUFFER = 1000
+MAX_SUBSCRIBERS = 100
+# 无新推文时发送心跳的间隔（秒）
+KEEPALIVE_INTERVAL = 15
+# 从数据库补发时每批读取的条数
+REPLAY_BATCH = 500
+
+NEW_TWEETS_SQL = '''
+    SELECT rowid, tweetID, full_text, user_name, screen_name, created_ts, keywords
+    FROM tweets_v2
+    WHERE rowid > ? AND created_ts IS NOT NULL
+    ORDER BY rowid
+    LIMIT ?
+'''
+
+
+def fetch_tweet_events(cursor, after_rowid, limit=REPLAY_BATCH):
+    """读取 after_rowid 之后写入的推文，转换为 (rowid, 事件) 列表"""
+    cursor.execute(NEW_TWEETS_SQL, (after_rowid, limit))
+    events = []
+    for rowid, tweet_id, full_text, name, screen_name, created_ts, keywords in cursor.fetchall():
+        events.append((rowid, {
+            "id": tweet_id,
+            "text": full_text or '',
+            "author": {
+                "name": name or '',
+                "screen_name": screen_name
+            },
+            "created_ts": created_ts,
+            "keyword": normalize_keyword(keywords) if keywords else None,
+            "link": f"https://twitter.com/{screen_name}/status/{tweet_id}",
+            "influence": influence_level(screen_name)
+        }))
+    return events
+
+
+def open_replay_connection():
+    """补发专用的只读连接：补发在流式响应里进行，请求结束时归还连接池的时机已过，由调用方关闭"""
+    return open_connection(readonly=True)
+
+
+def format_sse(rowid, event):
+    return f"id: {rowid}\nevent: tweet\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+# 放进订阅者缓冲区的重置标记：tweets_v2 被清空，之后的 rowid 从 1 重新开始
+RESET_MARKER = (0, None)
+
+
+class Subscription:
+    def __init__(self, keywords, max_buffer):
+        self.keywords = keywords
+        self.events = queue.Queue(maxsize=max_buffer)
+        self.overflowed = False
+
+    def wants(self, event):
+        return not self.keywords or event['keyword'] in self.keywords
+
+
+class TweetBroker:
+    """进程内的新推文分发：写入提交后查询一次新行，再分发给所有订阅者
+
+    每个订阅者的缓冲区有上限，消费太慢导致缓冲区满时不再阻塞写入方，
+    而是标记该订阅者，由它自己从数据库按 rowid 补齐。
+    订阅时通过 read_connection() 取当前请求的只读连接；补发时用 replay_connection()
+    单独打开一个连接，补发结束后关闭。
+
+    tweets_v2 被清空（'tweets_reset' 数据版本变化）后 rowid 从 1 重新开始，
+    此时分发位置归零，并在每个订阅者的缓冲区放入 RESET_MARKER。
+    """
+
+    def __init__(self, max_buffer=MAX_BUFFER, max_subscribers=MAX_SUBSCRIBERS, read_connection=get_read_connection,
+                 replay_connection=open_replay_connection):
+        self.read_connection = read_connection
+        self.replay_connection = replay_connection
+        self.max_buffer = max_buffer
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._last_rowid = None
+        self._reset_version = None
+
+    def _check_reset(self, cursor):
+        """在持有 self._lock 时调用；发现表被清空过则返回 True 并重置分发位置"""
+        stamp = get_data_version(cursor, 'tweets_reset')
+        version = stamp[0] if stamp else 0
+        reset = self._reset_version is not None and version != self._reset_version
+        self._reset_version = version
+        if not reset:
+            return False
+        logger.info("tweets_v2 was cleared, restarting stream from rowid 0")
+        self._last_rowid = 0
+        for subscription in self._subscribers:
+            while not subscription.events.empty():
+                subscription.events.get_nowait()
+            subscription.overflowed = False
+            subscription.events.put_nowait(RESET_MARKER)
+        return True
+
+    def subscribe(self, keywords=None):
+        """注册订阅者，返回 (订阅, 当前已分发到的 rowid)；订阅者已满时返回 None"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            cursor = self.read_connection().cursor()
+            if not self._subscribers or self._last_rowid is None:
+                self._reset_version = None
+                self._check_reset(cursor)
+                cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM tweets_v2')
+                self._last_rowid = cursor.fetchone()[0]
+            else:
+                self._check_reset(cursor)
+            subscription = Subscription(keywords, self.max_buffer)
+            self._subscribers.add(subscription)
+            logger.info("Stream subscriber added (%d active)", len(self._subscribers))
+            return subscription, self._last_rowid
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            logger.info("Stream subscriber removed (%d active)", len(self._subscribers))
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish_new_tweets(self, conn):
+        """写入提交后调用；没有订阅者时什么都不做"""
+        with self._lock:
+            if not self._subscribers:
+                return 0
+            cursor = conn.cursor()
+            self._check_reset(cursor)
+            published = 0
+            while True:
+                events = fetch_tweet_events(cursor, self._last_rowid)
+                if not events:
+                    break
+                for subscription in self._subscribers:
+                    if subscription.overflowed:
+                        continue
+                    for rowid, event in events:
+                        if not subscription.wants(event):
+                            continue
+                        try:
+                            subscription.events.put_nowait((rowid, event))
+                        except queue.Full:
+                            subscription.overflowed = True
+                            break
+                self._last_rowid = events[-1][0]
+                published += len(events)
+            return published
+
+    def stream(self, last_event_id=None, keywords=None, keepalive=KEEPALIVE_INTERVAL):
+        """SSE 生成器；带 last_event_id 时先从数据库补发之后的推文。订阅者已满时返回 None"""
+        subscribed = self.subscribe(keywords)
+        if subscribed is None:
+            return None
+        subscription, head_rowid = subscribed
+        return self._events(subscription, head_rowid, last_event_id, keepalive)
+
+    def _replay(self, subscription, after_rowid, until_rowid):
+        conn = self.replay_connection()
+        try:
+            cursor = conn.cursor()
+            while after_rowid < until_rowid:
+                events = fetch_tweet_events(cursor, after_rowid)
+                if not events:
+                    break
+                for rowid, event in events:
+                    if rowid > until_rowid:
+                        return
+                    if subscription.wants(event):
+                        yield rowid, event
+                    after_rowid = rowid
+        finally:
+            conn.close()
+
+    def _events(self, subscription, head_rowid, last_event_id, keepalive):
+        # Last-Event-ID 大于当前最大 rowid 说明是表被清空前的位置，不再补发
+        if last_event_id is not None and last_event_id > head_rowid:
+            last_event_id = None
+        sent_rowid = max(head_rowid, last_event_id or 0)
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id is not None and last_event_id < head_rowid:
+                for rowid, event in self._replay(subscription, last_event_id, head_rowid):
+                    yield format_sse(rowid, event)
+
+            while True:
+                if subscription.overflowed:
+                    # 缓冲区满过：丢弃缓冲内容，从上次发出的位置按 rowid 补齐
+                    with self._lock:
+                        while not subscription.events.empty():
+                            subscription.events.get_nowait()
+                        subscription.overflowed = False
+                        published_rowid = self._last_rowid
+                    for rowid, event in self._replay(subscription, sent_rowid, published_rowid):
+                        sent_rowid = rowid
+                        yield format_sse(rowid, event)
+                    sent_rowid = max(sent_rowid, published_rowid)
+                    continue
+
+                try:
+                    rowid, event = subscription.events.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    sent_rowid = 0
+                    continue
+                if rowid <= sent_rowid:
+                    continue
+                sent_rowid = rowid
+                yield format_sse(rowid, event)
+        finally:
+            self.unsubscribe(subscription)
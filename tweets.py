@@ -1,11 +1,21 @@
 from flask import Flask, request, jsonify, Response
 import sqlite3
 from datetime import datetime, timedelta
+from html import escape
 from zoneinfo import ZoneInfo
 import json
 import traceback
 
+from db import get_connection, get_read_connection, release_thread_connections
+from service_log import get_logger, log_payload, RequestTimer
+from kol_registry import meme_kols
+from tweet_render import LEGACY_TWEET_ROW, page_head, render_page
+from twitter_time import any_time_to_epoch, twitter_times_to_epochs
+
 app = Flask(__name__)
+app.teardown_appcontext(release_thread_connections)
+
+logger = get_logger('tweets')
 
 import re
 
@@ -20,24 +30,17 @@ def extract_username(url):
     else:
         return None
 
-# Database connection
-def connect_db():
-    conn = sqlite3.connect('/home/lighthouse/tweets.db')
-    return conn
-
-
 # API to insert multiple tweets into the database
 @app.route('/add_tweets', methods=['POST'])
 def add_tweets():
-    print("add_tweets function called")
     try:
         data = request.json
         if not data:
-            print("No JSON data received")
+            logger.warning("No JSON data received")
             return jsonify({"error": "No JSON data received"}), 400
 
-        print(f"Received {len(data)} tweets")
-        conn = connect_db()
+        logger.debug("Received %s tweets", len(data))
+        conn = get_connection()
         cursor = conn.cursor()
 
         inserted_tweets = []
@@ -45,14 +48,14 @@ def add_tweets():
 
         for tweet in data:
             try:
-                print(f"Processing tweet: {tweet.get('TweetId', 'Unknown ID')}")
+                logger.debug("Processing tweet: %s", tweet.get('TweetId', 'Unknown ID'))
                 # Check if a tweet with the same TweetId and TweetType exists
                 cursor.execute('SELECT TweetId FROM tweets WHERE TweetId = ? AND TweetType = ?', 
                                (tweet['TweetId'], tweet['TweetType']))
                 result = cursor.fetchone()
 
                 if result:
-                    print(f"Tweet {tweet['TweetId']} already exists, skipping")
+                    logger.debug("Tweet %s already exists, skipping", tweet['TweetId'])
                     skipped_tweets.append(tweet['TweetId'])
                 else:
                     cursor.execute('''
@@ -61,33 +64,32 @@ def add_tweets():
                     ''', (
                     tweet['Title'], tweet['Author'], tweet['CreateTime'], tweet['UserName'], 
                     tweet['TweetId'], tweet['Score'], tweet['TweetType']))
-                    print(f"Tweet {tweet['TweetId']} inserted successfully")
+                    logger.debug("Tweet %s inserted successfully", tweet['TweetId'])
                     inserted_tweets.append(tweet['TweetId'])
             except KeyError as ke:
-                print(f"KeyError processing tweet: {ke}")
+                logger.warning("KeyError processing tweet: %s", ke)
+                conn.rollback()
                 return jsonify({"error": f"Missing key in tweet data: {ke}"}), 400
             except Exception as e:
-                print(f"Error inserting tweet {tweet.get('TweetId', 'Unknown ID')}: {str(e)}")
+                logger.warning("Error inserting tweet %s: %s", tweet.get('TweetId', 'Unknown ID'), str(e))
                 conn.rollback()
                 return jsonify({"error": f"Error inserting tweet {tweet.get('TweetId', 'Unknown ID')}: {str(e)}"}), 500
 
         conn.commit()
-        conn.close()
 
-        print(f"Operation completed. Inserted: {len(inserted_tweets)}, Skipped: {len(skipped_tweets)}")
+        logger.info("Operation completed. Inserted: %s, Skipped: %s", len(inserted_tweets), len(skipped_tweets))
         return jsonify({"inserted": inserted_tweets, "skipped": skipped_tweets}), 200
 
     except Exception as e:
-        print(f"Unexpected error in add_tweets: {str(e)}")
+        logger.exception("Unexpected error in add_tweets: %s", str(e))
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
 # API to get today's tweets
 @app.route('/get_todays_tweets', methods=['GET'])
 def get_todays_tweets():
-    print("..get_todays_tweets")
     tweet_type = request.args.get('tweet_type')
 
-    conn = connect_db()
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     yesterday = (datetime.utcnow() - timedelta(days=1)).strftime('%a %b %d')
@@ -118,15 +120,13 @@ def get_todays_tweets():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 
 # API to get the latest 50 tweets, sorted by CreateTime
 @app.route('/get_latest_tweets', methods=['GET'])
 def get_latest_tweets():
     tweet_type = request.args.get('tweet_type')
-    conn = connect_db()
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     try:
@@ -155,31 +155,20 @@ def get_latest_tweets():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 # API to get today's tweets formatted for Twitter posting
 @app.route('/get_tweets_formated', methods=['GET'])
 def get_tweets_formated():
-    print("Entering get_tweets_formated function")
     tweet_type = request.args.get('tweet_type')
     if tweet_type == "meme":
         tweet_type = "Meme"
-    conn = connect_db()
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     # 使用北京时间
     now = datetime.now(ZoneInfo("Asia/Shanghai"))
     two_days_ago = now - timedelta(days=2)
 
-    # 读取 meme_kols.csv 文件
-    meme_kols = {}
-    with open('./data/meme_kols.csv', 'r') as f:
-        next(f)  # 跳过标题行
-        for line in f:
-            username, influence = line.strip().split(',')[:2]
-            meme_kols[username.lower()] = influence
-
     try:
         # 先获取最新的500条数据
         if tweet_type:
@@ -188,136 +177,62 @@ def get_tweets_formated():
             cursor.execute("SELECT Title, Author, CreateTime, UserName, TweetId, TweetType, Score FROM tweets ORDER BY CreateTime DESC LIMIT 500")
         rows = cursor.fetchall()
 
-        print(f"Retrieved {len(rows)} tweets from database")
+        logger.debug("Retrieved %s tweets from database", len(rows))
 
-        # 过滤出距离现在不超过48小时的数据
+        # 过滤出距离现在不超过48小时的数据，解析结果留给渲染使用
+        shanghai = ZoneInfo("Asia/Shanghai")
+        since_ts = two_days_ago.timestamp()
         filtered_rows = []
-        for row in rows:
-            try:
-                # Try parsing with the old format first
-                create_time = datetime.strptime(row[2], "%a %b %d %H:%M:%S %z %Y")
-            except ValueError:
-                try:
-                    # If old format fails, try the new format
-                    create_time = datetime.strptime(row[2], "%Y-%m-%d %H:%M:%S%z")
-                except ValueError:
-                    print(f"Unable to parse date: {row[2]}")
-                    continue  # Skip this row if both formats fail
-            
-            create_time = create_time.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("Asia/Shanghai"))
-            if create_time >= two_days_ago:
-                filtered_rows.append(row)
-
-        print(f"Filtered {len(filtered_rows)} tweets within the last 48 hours")
+        for row, created_ts in zip(rows, twitter_times_to_epochs((row[2] for row in rows), any_time_to_epoch)):
+            # 兼容 Twitter 格式和 "%Y-%m-%d %H:%M:%S%z" 两种格式
+            if created_ts is None:
+                logger.warning("Unable to parse date: %s", row[2])
+                continue  # Skip this row if both formats fail
+            if created_ts >= since_ts:
+                filtered_rows.append((row, datetime.fromtimestamp(created_ts, shanghai)))
+
+        logger.debug("Filtered %s tweets within the last 48 hours", len(filtered_rows))
 
         if not filtered_rows:
             error_message = f"没有找到最近48小时内的推文。"
-            print(error_message)
+            logger.info(error_message)
             return Response(f"<h1>没有数据</h1><p>{error_message}</p><p>请检查数据库中是否有最近的数据，或者时区设置是否正确。</p>", mimetype='text/html')
 
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="zh-CN">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>最新热门推文</title>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    max-width: 800px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                h1 {{
-                    color: #1da1f2;
-                    text-align: center;
-                }}
-                .tweet {{
-                    background-color: #f8f9fa;
-                    border: 1px solid #e1e8ed;
-                    border-radius: 10px;
-                    padding: 15px;
-                    margin-bottom: 20px;
-                }}
-                .tweet-title {{
-                    font-size: 18px;
-                    font-weight: bold;
-                    margin-bottom: 10px;
-                }}
-                .tweet-info {{
-                    font-size: 14px;
-                    color: #657786;
-                }}
-                .tweet-link {{
-                    color: #1da1f2;
-                    text-decoration: none;
-                }}
-                .tweet-link:hover {{
-                    text-decoration: underline;
-                }}
-            </style>
-        </head>
-        <body>
-            <h1>🔥 最新热门推文 🔥</h1>
-            <p>更新时间: {now.strftime('%Y年%m月%d日 %H:%M:%S')} 北京时间</p>
-            <p>显示范围: 最近48小时</p>
-            <p>总计显示: {len(filtered_rows)} 条推文</p>
-        """
-
-        for row in filtered_rows:
-            title, author, create_time, username, tweet_id, tweet_type, score = row
+        def render_row(item):
+            (title, author, _, username, tweet_id, tweet_type, score), create_time = item
             link = f"https://twitter.com/{username}/status/{tweet_id}"
-            influence = meme_kols.get(username.lower(), "未知") if username else "未知"
-            
-            try:
-                create_time_obj = datetime.strptime(create_time, "%a %b %d %H:%M:%S %z %Y")
-            except ValueError:
-                create_time_obj = datetime.strptime(create_time, "%Y-%m-%d %H:%M:%S%z")
-            
-            create_time_obj = create_time_obj.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("Asia/Shanghai"))
-            create_time_cn = create_time_obj.strftime("%Y年%m月%d日 %H:%M:%S")
-            
-            html_content += f"""
-            <div class="tweet">
-                <div class="tweet-title">{title}</div>
-                <div class="tweet-info">
-                    <p>👤 作者: {author} @{username}</p>
-                    <p>🕒 时间: {create_time_cn}</p>
-                    <p>🔗 链接: <a href="{link}" target="_blank" class="tweet-link">{link}</a></p>
-                    <p>📊 类型: {tweet_type}</p>
-                    <p>💯 评分: {score}</p>
-                    <p>🌟 影响力: {influence}</p>
-                </div>
-            </div>
-            """
-
-        html_content += """
-        </body>
-        </html>
-        """
-
-        print("Successfully generated HTML content")
-        return Response(html_content, mimetype='text/html')
+            influence = meme_kols.get(username, "未知")
+            return LEGACY_TWEET_ROW(
+                title=escape(title or ''),
+                author=escape(author or ''),
+                username=escape(username or ''),
+                created_at=create_time.strftime("%Y年%m月%d日 %H:%M:%S"),
+                link=escape(link),
+                tweet_type=escape(str(tweet_type)),
+                score=escape(str(score)),
+                influence=escape(influence)
+            )
+
+        head = page_head(now.strftime('%Y年%m月%d日 %H:%M:%S'), "显示范围: 最近48小时", f"总计显示: {len(filtered_rows)} 条推文")
+        pages = render_page(head, filtered_rows, render_row)
+
+        # ?stream=1 时边渲染边输出
+        if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+            return Response(pages, mimetype='text/html')
+        return Response(''.join(pages), mimetype='text/html')
 
     except Exception as e:
         error_message = f"发生错误: {str(e)}"
-        print(error_message)
+        logger.exception(error_message)
         traceback_info = traceback.format_exc()
-        print(traceback_info)
-        return Response(f"<h1>发生错误</h1><p>{error_message}</p><pre>{traceback_info}</pre>", mimetype='text/html', status=500)
-    finally:
-        conn.close()
-        print("Exiting get_tweets_formated function")
+        return Response(f"<h1>发生错误</h1><p>{escape(error_message)}</p><pre>{escape(traceback_info)}</pre>", mimetype='text/html', status=500)
 
 
 # API to get the total number of records ordered by CreateTime
 @app.route('/get_total_tweets', methods=['GET'])
 def get_total_tweets():
     tweet_type = request.args.get('tweet_type')
-    conn = connect_db()
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     try:
@@ -331,24 +246,22 @@ def get_total_tweets():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 # API to add all tweets
 @app.route('/add_all_tweets', methods=['POST'])
 def add_all_tweets():
-    print("Entering add_all_tweets function")
+    timer = RequestTimer(logger, 'add_all_tweets')
     try:
-        data = request.json
-        print("Raw received data:")
-        print(json.dumps(data, indent=2))  # Print the raw received data
+        with timer.stage('parse'):
+            data = request.json
+        log_payload(logger, "Raw received data", data)
         
         if not data or 'output' not in data:
-            print("Invalid data format received")
-            print(f"Received data structure: {type(data)}")
+            logger.warning("Invalid data format received")
+            logger.warning("Received data structure: %s", type(data))
             return jsonify({"error": "Invalid data format", "details": "Expected 'output' key in JSON data"}), 400
 
-        print(f"Number of output groups: {len(data['output'])}")
+        logger.debug("Number of output groups: %s", len(data['output']))
         
         tweets = []
         parsing_errors = []
@@ -367,21 +280,19 @@ def add_all_tweets():
                     if isinstance(parsed_tweets, list):
                         tweets.extend(parsed_tweets)
                     else:
-                        print(f"Invalid format in output group {i}: expected list, got {type(parsed_tweets)}")
+                        logger.warning("Invalid format in output group %s: expected list, got %s", i, type(parsed_tweets))
                         parsing_errors.append(f"Invalid format in output group {i}: expected list, got {type(parsed_tweets)}")
                 except json.JSONDecodeError as e:
-                    print(f"JSON parsing error in output group {i}: {e}")
+                    logger.warning("JSON parsing error in output group %s: %s", i, e)
                     parsing_errors.append(f"JSON parsing error in output group {i}: {e}")
-                    print("Problematic JSON string:")
-                    print(json_str)
                 except Exception as e:
-                    print(f"Unexpected error parsing output group {i}: {e}")
+                    logger.warning("Unexpected error parsing output group %s: %s", i, e)
                     parsing_errors.append(f"Unexpected error parsing output group {i}: {e}")
 
-        print(f"Total tweets extracted: {len(tweets)}")
-        print(f"Total parsing errors: {len(parsing_errors)}")
+        logger.info("Total tweets extracted: %s", len(tweets))
+        logger.info("Total parsing errors: %s", len(parsing_errors))
 
-        conn = connect_db()
+        conn = get_connection()
         cursor = conn.cursor()
 
         inserted_count = 0
@@ -392,12 +303,12 @@ def add_all_tweets():
         for index, tweet in enumerate(tweets):
             try:
                 tweet_id = tweet.get('TweetId', 'Unknown ID')
-                print(f"Processing tweet {index + 1}/{len(tweets)}: {tweet_id}")
+                logger.debug("Processing tweet %s/%s: %s", index + 1, len(tweets), tweet_id)
                 
                 cursor.execute("SELECT TweetId FROM tweets WHERE TweetId = ?", (tweet_id,))
                 existing_tweet = cursor.fetchone()
                 if existing_tweet:
-                    print(f"Tweet {tweet_id} already exists (Existing TweetId: {existing_tweet[0]}), skipping")
+                    logger.debug("Tweet %s already exists (Existing TweetId: %s), skipping", tweet_id, existing_tweet[0])
                     skipped_count += 1
                     continue
 
@@ -416,25 +327,22 @@ def add_all_tweets():
                     tweet['Score']
                 ))
                 inserted_count += 1
-                print(f"Inserted tweet {tweet_id}")
+                logger.debug("Inserted tweet %s", tweet_id)
             except sqlite3.IntegrityError as ie:
-                print(f"IntegrityError: Tweet {tweet_id} already exists")
+                logger.debug("IntegrityError: Tweet %s already exists", tweet_id)
                 skipped_count += 1
                 error_details.append(f"IntegrityError for tweet {tweet_id}: {str(ie)}")
             except KeyError as ke:
-                print(f"KeyError processing tweet: {ke}")
+                logger.warning("KeyError processing tweet: %s", ke)
                 error_count += 1
                 error_details.append(f"KeyError for tweet {tweet_id}: Missing key {str(ke)}")
             except Exception as e:
-                print(f"Error processing tweet {tweet_id}: {str(e)}")
+                logger.warning("Error processing tweet %s: %s", tweet_id, str(e))
                 error_count += 1
                 error_details.append(f"Error for tweet {tweet_id}: {str(e)}")
 
-            if (index + 1) % 10 == 0:
-                print(f"Progress: {index + 1}/{len(tweets)} tweets processed")
-
         conn.commit()
-        print(f"Operation completed. Inserted: {inserted_count}, Skipped: {skipped_count}, Errors: {error_count}")
+        timer.summary(status=200, inserted=inserted_count, skipped=skipped_count, errors=error_count)
         return jsonify({
             "message": f"Operation completed",
             "inserted": inserted_count,
@@ -444,17 +352,14 @@ def add_all_tweets():
             "parsing_errors": parsing_errors
         }), 200
     except Exception as e:
-        print(f"Unexpected error in add_all_tweets: {str(e)}")
-        traceback.print_exc()  # This will print the full traceback
+        logger.exception("Unexpected error in add_all_tweets: %s", str(e))
+        if 'conn' in locals():
+            conn.rollback()
         return jsonify({
             "error": "Unexpected error",
             "details": str(e),
             "traceback": traceback.format_exc()
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
-        print("Exiting add_all_tweets function")
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5003)
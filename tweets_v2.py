@@ -1,13 +1,32 @@
 from flask import Flask, request, jsonify, Response
-import sqlite3
 from datetime import datetime, timedelta
+from html import escape
 from zoneinfo import ZoneInfo
-import json
-import traceback
-import os
+import logging
+import queue
+import sqlite3
+
+from db import get_connection, get_read_connection, open_connection, release_thread_connections
+from tweet_content import load_raw_tweets
+from tweet_ingest import ingest_payload, normalize_keyword
+from ingest_queue import IngestQueue
+from kol_registry import influence_level
+from raw_archive import RawArchive
+from recent_ids import RecentIdFilter
+from response_cache import ResponseCache, cached_response
+from migrate_tweets_v2 import ensure_tweets_v2_schema
+from service_log import get_logger, log_payload, RequestTimer
+from tweet_stream import TweetBroker
+from tweet_render import TWEET_V2_ROW, page_head, render_page, unescape_text
 
 app = Flask(__name__)
 app.config['DEBUG'] = True  # Enable debug mode
+app.teardown_appcontext(release_thread_connections)
+
+logger = get_logger('tweets_v2')
+
+# GET 接口的响应缓存，推文写入提交后失效
+response_cache = ResponseCache()
 
 import re
 
@@ -22,584 +41,446 @@ def extract_username(url):
     else:
         return None
 
-# Database connection
-def connect_db():
-    conn = sqlite3.connect('/home/lighthouse/tweets.db')
-    return conn
+# 增量拉取单次最多返回的条数
+MAX_TWEETS_LIMIT = 500
 
 
-def get_influence_level(influence):
-    try:
-        influence_value = int(influence)
-        if influence_value == 1:
-            return "低"
-        elif influence_value == 2:
-            return "中"
-        elif influence_value == 3:
-            return "高"
-        elif influence_value > 3:
-            return "超高"
-        else:
-            return "未知"
-    except ValueError:
-        return "未知"
+def format_tweet_rows(cursor, rows, include_raw):
+    """把 (rowid, tweetID, full_text, user_name, screen_name, CreatedAt, created_ts) 行转换为接口格式"""
+    # 只有显式请求时才读取并解压原始推文
+    raw_tweets = {}
+    if include_raw and rows:
+        raw_tweets = load_raw_tweets(cursor, [row[1] for row in rows])
+
+    shanghai = ZoneInfo("Asia/Shanghai")
+    formatted_tweets = []
+    for _, tweet_id, full_text, name, screen_name, created_at, created_ts in rows:
+        # 解码 full_text 和 name，与 HTML 页面共用同一套转义还原，中文等非 ASCII 字符保持不变
+        full_text = unescape_text(full_text)
+        name = unescape_text(name)
+        
+        create_time_obj = datetime.fromtimestamp(created_ts, shanghai)
+        create_time_cn = create_time_obj.strftime("%Y年%m月%d日 %H:%M:%S")
+        
+        link = f"https://twitter.com/{screen_name}/status/{tweet_id}"
+        
+        formatted_tweet = {
+            "text": full_text,
+            "author": {
+                "name": name,
+                "screen_name": screen_name
+            },
+            "created_at": create_time_cn,
+            "id": tweet_id,
+            "link": link,
+            "influence": influence_level(screen_name)
+        }
+        if include_raw:
+            formatted_tweet["raw"] = raw_tweets.get(tweet_id)
+        formatted_tweets.append(formatted_tweet)
+    return formatted_tweets
+
+
+def get_new_tweets(cursor, after_rowid, limit, include_raw, timer):
+    """按 rowid 增量拉取 after_rowid 之后写入的推文，按写入顺序返回"""
+    with timer.stage('db'):
+        cursor.execute("""
+        SELECT rowid, tweetID, full_text, user_name, screen_name, CreatedAt, created_ts
+        FROM tweets_v2
+        WHERE rowid > ? AND created_ts IS NOT NULL
+        ORDER BY rowid
+        LIMIT ?
+        """, (after_rowid, limit + 1))
+        rows = cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    formatted_tweets = format_tweet_rows(cursor, rows, include_raw)
+
+    timer.summary(status=200, tweets=len(formatted_tweets), cursor=after_rowid)
+    return jsonify({
+        "tweets": formatted_tweets,
+        "total": len(formatted_tweets),
+        "next_cursor": str(rows[-1][0] if rows else after_rowid),
+        "has_more": has_more,
+        "updated_at": datetime.now(ZoneInfo("UTC")).strftime('%Y-%m-%d %H:%M:%S')
+    }), 200
+
 
 # API to get today's tweets
+# 增量拉取：?cursor=<上次返回的 next_cursor> 或 ?since_id=<上次收到的最后一条推文 ID>，
+# 配合 ?limit=N（默认和最大均为 500），只返回之后新写入的推文。
+# cursor 基于 tweets_v2 的 rowid；对 tweets_v2 执行 VACUUM 可能重排 rowid，清空 tweets_v2 后 rowid
+# 从 1 重新开始，这两种情况之后都需要丢弃旧 cursor 重新获取。
 @app.route('/get_tweets', methods=['GET'])
+@cached_response(response_cache, 'tweets')
 def get_tweets():
-    print("get_tweets function called")
-    conn = connect_db()
+    timer = RequestTimer(logger, 'get_tweets')
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     # Use UTC time for consistency
     now = datetime.now(ZoneInfo("UTC"))
     today = now.strftime('%Y-%m-%d')
     tomorrow = (now + timedelta(days=1)).strftime('%Y-%m-%d')
+    window_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = window_start + timedelta(days=2)
 
-    print(f"Querying for tweets from {today} and {tomorrow}")
+    include_raw = request.args.get('raw', '').lower() in ('1', 'true', 'yes')
 
-    # 读取 meme_kols.csv 文件
-    meme_kols = {}
-    with open('./data/meme_kols.csv', 'r') as f:
-        next(f)  # 跳过标题行
-        for line in f:
-            username, influence = line.strip().split(',')[:2]
-            meme_kols[username.lower()] = influence
+    try:
+        limit = min(int(request.args.get('limit', MAX_TWEETS_LIMIT)), MAX_TWEETS_LIMIT)
+        after_rowid = int(request.args['cursor']) if request.args.get('cursor') else None
+        if limit < 1 or (after_rowid is not None and after_rowid < 0):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "cursor and limit must be positive integers"}), 400
 
     try:
-        # Fetch the latest 500 tweets
-        query = """
-        SELECT Content, CreatedAt FROM tweets_v2 
-        ORDER BY CreatedAt DESC
-        LIMIT 500
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        since_id = request.args.get('since_id')
+        if after_rowid is None and since_id:
+            cursor.execute("SELECT rowid FROM tweets_v2 WHERE tweetID = ?", (since_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return jsonify({"error": f"Unknown since_id: {since_id}"}), 400
+            after_rowid = row[0]
 
-        print(f"Fetched {len(rows)} tweets")
+        if after_rowid is not None:
+            return get_new_tweets(cursor, after_rowid, limit, include_raw, timer)
 
-        # Filter tweets for today and tomorrow
-        filtered_tweets = []
-        for row in rows:
-            content = json.loads(row[0])
-            created_at = row[1]
-            tweet_date = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y").strftime('%Y-%m-%d')
-            if tweet_date in [today, tomorrow]:
-                filtered_tweets.append(content)
+        logger.debug("Querying for tweets from %s and %s", today, tomorrow)
 
-        print(f"Filtered to {len(filtered_tweets)} tweets for today and tomorrow")
+        # Fetch the latest tweets for today and tomorrow
+        query = """
+        SELECT rowid, tweetID, full_text, user_name, screen_name, CreatedAt, created_ts
+        FROM tweets_v2 
+        WHERE created_ts >= ? AND created_ts < ?
+        ORDER BY created_ts DESC
+        LIMIT ?
+        """
+        with timer.stage('db'):
+            cursor.execute(query, (int(window_start.timestamp()), int(window_end.timestamp()), limit))
+            filtered_rows = cursor.fetchall()
 
-        if not filtered_tweets:
-            print("No tweets found for today or tomorrow")
+        if not filtered_rows:
+            timer.summary(status=404, tweets=0)
             return jsonify({"error": "No tweets found for today or tomorrow"}), 404
 
-        formatted_tweets = []
-        for tweet_data in filtered_tweets:
-            full_text = tweet_data.get('full_text', '')
-            # 解码 full_text
-            full_text = full_text.encode().decode('unicode_escape')
-            
-            name = tweet_data['user']['name']
-            # 解码 name
-            name = name.encode().decode('unicode_escape')
-            
-            screen_name = tweet_data['user']['screen_name']
-            created_at = tweet_data['created_at']
-            tweet_id = tweet_data['rest_id']
-            
-            create_time_obj = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y")
-            create_time_obj = create_time_obj.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("Asia/Shanghai"))
-            create_time_cn = create_time_obj.strftime("%Y年%m月%d日 %H:%M:%S")
-            
-            link = f"https://twitter.com/{screen_name}/status/{tweet_id}"
-            
-            # 获取影响力信息并转换
-            influence = meme_kols.get(screen_name.lower(), "未知")
-            influence_level = get_influence_level(influence)
-            
-            formatted_tweets.append({
-                "text": full_text,
-                "author": {
-                    "name": name,
-                    "screen_name": screen_name
-                },
-                "created_at": create_time_cn,
-                "id": tweet_id,
-                "link": link,
-                "influence": influence_level
-            })
+        formatted_tweets = format_tweet_rows(cursor, filtered_rows, include_raw)
 
+        timer.summary(status=200, tweets=len(formatted_tweets))
         return jsonify({
             "tweets": formatted_tweets,
             "total": len(formatted_tweets),
+            # 之后可用 ?cursor= 只拉取新写入的推文
+            "next_cursor": str(max(row[0] for row in filtered_rows)),
             "updated_at": now.strftime('%Y-%m-%d %H:%M:%S')
         }), 200
 
     except Exception as e:
-        print(f"Error in get_tweets: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Error in get_tweets: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 
 # API to get today's tweets formatted for Twitter posting
 @app.route('/get_tweets_formated', methods=['GET'])
+@cached_response(response_cache, 'tweets')
 def get_tweets_formated():
-    conn = connect_db()
+    timer = RequestTimer(logger, 'get_tweets_formated')
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     # 使用 UTC 时间
     now = datetime.now(ZoneInfo("UTC"))
     two_days_ago = (now - timedelta(hours=48))
-    print(f"Querying for tweets from {two_days_ago.strftime('%Y-%m-%d %H:%M:%S %z')} to {now.strftime('%Y-%m-%d %H:%M:%S %z')}")
+    logger.debug("Querying for tweets from %s to %s", two_days_ago, now)
     
-    # 读取 meme_kols.csv 文件
-    meme_kols = {}
     try:
-        with open('./data/meme_kols.csv', 'r') as f:
-            next(f)  # 跳过标题行
-            for line in f:
-                username, influence = line.strip().split(',')[:2]
-                meme_kols[username.lower()] = influence
-        print(f"Loaded {len(meme_kols)} KOL records")
-    except Exception as e:
-        print(f"Error reading meme_kols.csv: {e}")
-        meme_kols = {}  # 如果文件读取失败，使用空字典
-
-    try:
-        # 首先检查数据库中是否有数据
-        cursor.execute("SELECT COUNT(*) FROM tweets_v2")
-        total_count = cursor.fetchone()[0]
-        print(f"Total tweets in database: {total_count}")
-
-        # 修改查询语句，先获取最新的推文进行检查
-        check_query = """
-        SELECT Content, CreatedAt, keywords FROM tweets_v2 
-        ORDER BY rowid DESC
-        LIMIT 5
-        """
-        cursor.execute(check_query)
-        check_rows = cursor.fetchall()
-        
-        print("\nChecking most recent tweets by rowid:")
-        for i, row in enumerate(check_rows):
-            content = json.loads(row[0])
-            created_at = row[1]
-            keywords = row[2]
-            print(f"Tweet {i+1}: Created at {created_at}, Keywords: {keywords}")
-
-        # 主查询
+        # 主查询，时间窗口直接在 SQL 中过滤
         query = """
-        SELECT Content, CreatedAt, keywords FROM tweets_v2 
-        WHERE CreatedAt IS NOT NULL
-        ORDER BY rowid DESC
+        SELECT tweetID, full_text, user_name, screen_name, CreatedAt, created_ts, keywords
+        FROM tweets_v2 
+        WHERE created_ts BETWEEN ? AND ?
+        ORDER BY created_ts DESC
         LIMIT 500
         """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        print(f"\nFetched {len(rows)} tweets for processing")
+        with timer.stage('db'):
+            cursor.execute(query, (int(two_days_ago.timestamp()), int(now.timestamp())))
+            filtered_tweets = cursor.fetchall()
+
+        # 如果没有找到推文，DEBUG 级别下输出最近几条推文的时间便于排查
+        if not filtered_tweets and logger.isEnabledFor(logging.DEBUG):
+            cursor.execute("SELECT CreatedAt, keywords FROM tweets_v2 ORDER BY rowid DESC LIMIT 5")
+            for i, (created_at, keywords) in enumerate(cursor.fetchall()):
+                logger.debug("Recent tweet %d: created at %s, keywords: %s", i + 1, created_at, keywords)
+
+        shanghai = ZoneInfo("Asia/Shanghai")
+        def render_row(row):
+            tweet_id, full_text, name, screen_name, created_at, created_ts, keywords = row
+            create_time_cn = datetime.fromtimestamp(created_ts, shanghai).strftime("%Y年%m月%d日 %H:%M:%S")
+            link = f"https://twitter.com/{screen_name}/status/{tweet_id}"
 
-        # 修改日期过滤逻辑
-        filtered_tweets = []
-        for row in rows:
-            try:
-                content = json.loads(row[0])
-                created_at = row[1]
-                keywords = row[2] or "未知"
-                content['keywords'] = keywords
-
-                # 解析日期并进行比较
-                tweet_date = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y")
-                tweet_date_utc = tweet_date.astimezone(ZoneInfo("UTC"))
-
-                print(f"\nProcessing tweet date: {tweet_date_utc}")
-                print(f"Comparing with range: {two_days_ago} to {now}")
-
-                if two_days_ago <= tweet_date_utc <= now:
-                    filtered_tweets.append(content)
-                    print("Tweet included")
-                else:
-                    print("Tweet excluded")
-
-            except Exception as e:
-                print(f"Error processing row: {e}")
-                continue
-
-        print(f"\nFiltered to {len(filtered_tweets)} tweets within last 48 hours")
-
-        # 如果没有找到推文，添加更多调试信息
-        if not filtered_tweets:
-            print("\nNo tweets found within last 48 hours")
-            print(f"Current time (UTC): {now}")
-            print(f"Two days ago (UTC): {two_days_ago}")
-            
-            # 显示最近5条推文的日期
-            print("\nMost recent 5 tweets dates:")
-            for i, row in enumerate(rows[:5]):
-                content = json.loads(row[0])
-                created_at = row[1]
-                print(f"Tweet {i+1}: {created_at}")
-
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="zh-CN">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>最新热门推文</title>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    max-width: 800px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                h1 {{
-                    color: #1da1f2;
-                    text-align: center;
-                }}
-                .tweet {{
-                    background-color: #f8f9fa;
-                    border: 1px solid #e1e8ed;
-                    border-radius: 10px;
-                    padding: 15px;
-                    margin-bottom: 20px;
-                }}
-                .tweet-text {{
-                    font-size: 16px;
-                    margin-bottom: 10px;
-                }}
-                .tweet-info {{
-                    font-size: 14px;
-                    color: #657786;
-                }}
-                .tweet-link {{
-                    color: #1da1f2;
-                    text-decoration: none;
-                }}
-                .tweet-link:hover {{
-                    text-decoration: underline;
-                }}
-            </style>
-        </head>
-        <body>
-            <h1>🔥 最新热门推文 🔥</h1>
-            <p>更新时间: {now.strftime('%Y年%m月%d日 %H:%M:%S')} 北京时间</p>
-        """
+            return TWEET_V2_ROW(
+                text=escape(unescape_text(full_text)),
+                name=escape(unescape_text(name)),
+                screen_name=escape(screen_name or ''),
+                created_at=create_time_cn,
+                keywords=escape(keywords or "未知"),
+                link=escape(link),
+                influence=influence_level(screen_name)
+            )
 
-        for tweet_data in filtered_tweets:
-            full_text = tweet_data.get('full_text', '')
-            full_text = full_text.encode().decode('unicode_escape')
-            
-            name = tweet_data['user']['name']
-            name = name.encode().decode('unicode_escape')
-            
-            screen_name = tweet_data['user']['screen_name']
-            created_at = tweet_data['created_at']
-            tweet_id = tweet_data['rest_id']
-            keywords = tweet_data.get('keywords', '未知')  # 获取 keywords
-            
-            create_time_obj = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y")
-            create_time_obj = create_time_obj.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("Asia/Shanghai"))
-            create_time_cn = create_time_obj.strftime("%Y年%m月%d日 %H:%M:%S")
-            
-            link = f"https://twitter.com/{screen_name}/status/{tweet_id}"
-            
-            try:
-                influence = meme_kols.get(screen_name.lower(), "未知")
-                influence_level = get_influence_level(influence)
-            except Exception as e:
-                print(f"Error getting influence level for {screen_name}: {e}")
-                influence_level = "未知"
-            
-            html_content += f"""
-            <div class="tweet">
-                <div class="tweet-text">{full_text}</div>
-                <div class="tweet-info">
-                    <p>👤 作者: {name} @{screen_name}</p>
-                    <p>🕒 时间: {create_time_cn}</p>
-                    <p>🔍 检索词: {keywords}</p>
-                    <p>🔗 链接: <a href="{link}" target="_blank" class="tweet-link">{link}</a></p>
-                    <p>🌟 影响力: {influence_level}</p>
-                </div>
-            </div>
-            """
-
-        html_content += """
-        </body>
-        </html>
-        """
+        pages = render_page(page_head(now.strftime('%Y年%m月%d日 %H:%M:%S')), filtered_tweets, render_row)
+        timer.summary(status=200, tweets=len(filtered_tweets))
 
-        return Response(html_content, mimetype='text/html')
+        # ?stream=1 时边渲染边输出，否则拼成完整页面（可被缓存）
+        if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+            return Response(pages, mimetype='text/html')
+        return Response(''.join(pages), mimetype='text/html')
 
     except Exception as e:
-        print(f"Error in get_todays_tweets_formated: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
-        return Response(f"<h1>发生错误</h1><p>{str(e)}</p>", mimetype='text/html', status=500)
-    finally:
-        conn.close()
+        logger.exception("Error in get_tweets_formated: %s", e)
+        return Response(f"<h1>发生错误</h1><p>{escape(str(e))}</p>", mimetype='text/html', status=500)
 
 
-def save_raw_data(data, prefix="tweets"):
-    """保存原始数据到文件"""
+# 原始请求归档，后台线程追加写入压缩分段
+raw_archive = RawArchive("/home/lighthouse/raw_data", "tweets")
+
+
+def validate_tweets_payload(data):
+    """校验 /add_all_tweets 的请求结构，合法时返回 None，否则返回错误信息"""
+    if not data or not isinstance(data, dict) or 'output' not in data:
+        logger.warning("Invalid JSON data received - expected an object with 'output' field")
+        return "Invalid JSON data received"
+
+    if not isinstance(data.get('output', []), list) or not isinstance(data.get('rune_names', []), list):
+        logger.warning("Invalid data structure - expected lists for output and rune_names")
+        return "Invalid data structure"
+
+    return None
+
+
+def process_tweets_payload(cursor, data):
+    """写线程中处理一次已入队的请求"""
+    return ingest_payload(cursor, data.get('output', []), data.get('rune_names', []), recent_ids)
+
+
+# 新推文的进程内分发，供 /stream/tweets 使用
+tweet_broker = TweetBroker()
+
+# 最近写入过的推文 ID，重复推文在写入前直接跳过
+recent_ids = RecentIdFilter()
+
+def publish_committed_tweets(conn):
+    """提交后确认 recent_ids，并把新写入的推文推送给 /stream/tweets 的订阅者"""
+    recent_ids.commit(conn)
     try:
-        # 创建 raw_data 目录（如果不存在）
-        data_dir = "/home/lighthouse/raw_data"
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-        
-        # 带时间戳的文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{data_dir}/{prefix}_{timestamp}.json"
-        
-        # 保存数据
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        print(f"Raw data saved to: {filename}")
-        return filename
+        tweet_broker.publish_new_tweets(conn)
     except Exception as e:
-        print(f"Error saving raw data: {str(e)}")
-        return None
+        logger.exception("Error publishing new tweets: %s", e)
+
+
+tweet_ingest_queue = IngestQueue(open_connection, process_tweets_payload,
+                                 on_commit=publish_committed_tweets, on_rollback=recent_ids.discard)
+
+
+def wants_async(req):
+    """?async=1 或 Prefer: respond-async 时走异步写入"""
+    if req.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in req.headers.get('Prefer', '')
+
 
 # API to add all tweets
 @app.route('/add_all_tweets', methods=['POST'])
 def add_all_tweets():
-    print("add_all_tweets function called")
+    timer = RequestTimer(logger, 'add_all_tweets')
     try:
-        data = request.json
-        print("=== Received Full Data ===")
-        print(json.dumps(data, indent=2))
-        print("=== End of Full Data ===\n")
+        with timer.stage('parse'):
+            data = request.json
+        log_payload(logger, "Received add_all_tweets payload", data)
 
         # 保存原始数据
-        saved_file = save_raw_data(data)
-        if saved_file:
-            print(f"Raw data saved to: {saved_file}")
-
-        if not data or not isinstance(data, dict) or 'output' not in data:
-            print("Invalid JSON data received - expected an object with 'output' field")
-            return jsonify({"error": "Invalid JSON data received"}), 400
+        with timer.stage('archive'):
+            raw_archive.append('add_all_tweets', data)
+
+        # 异步模式：只校验并入队，立即返回 202
+        if wants_async(request):
+            error = validate_tweets_payload(data)
+            if error:
+                timer.summary(status=400, mode='async')
+                return jsonify({"error": error}), 400
+            try:
+                job_id = tweet_ingest_queue.submit(data)
+            except queue.Full:
+                timer.summary(status=503, mode='async', pending=tweet_ingest_queue.pending())
+                return jsonify({"error": "Ingest queue is full, retry later"}), 503
+            timer.summary(status=202, mode='async', job_id=job_id, pending=tweet_ingest_queue.pending())
+            return jsonify({
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/ingest_status/{job_id}"
+            }), 202
+
+        error = validate_tweets_payload(data)
+        if error:
+            timer.summary(status=400)
+            return jsonify({"error": error}), 400
 
         output_list = data.get('output', [])
         rune_names = data.get('rune_names', [])  # 获取检索词列表
-        
-        if not isinstance(output_list, list) or not isinstance(rune_names, list):
-            print("Invalid data structure - expected lists for output and rune_names")
-            return jsonify({"error": "Invalid data structure"}), 400
 
-        conn = connect_db()
+        conn = get_connection()
         cursor = conn.cursor()
 
-        inserted_tweets = []
-        skipped_tweets = []
-        error_tweets = []
-        
-        # 遍历输出列表中的每个项
-        for item_index, (item, keyword) in enumerate(zip(output_list, rune_names)):
-            try:
-                free_busy = item.get('data', {}).get('freeBusy')
-                
-                if free_busy is None:
-                    print(f"Item {item_index + 1}: freeBusy is None, skipping")
-                    continue
-
-                tweets = free_busy.get('post', [])
-                if not tweets:
-                    print(f"Item {item_index + 1}: No tweets found")
-                    continue
-
-                print(f"Found {len(tweets)} tweets in item {item_index + 1}")
-                print(f"Using keyword: {keyword}")
-
-                for tweet_index, tweet in enumerate(tweets):
-                    try:
-                        tweet_id = tweet.get('rest_id')
-                        if not tweet_id:
-                            print(f"Missing tweet ID for tweet {tweet_index + 1}")
-                            raise ValueError("Missing tweet ID")
-
-                        content = json.dumps(tweet)
-                        created_at = tweet.get('created_at')
-                        userid = str(tweet.get('user', {}).get('rest_id', ''))
-
-                        print(f"Processing tweet {tweet_index + 1}/{len(tweets)}")
-                        print(f"Tweet ID: {tweet_id}, Created At: {created_at}, User ID: {userid}, Keyword: {keyword}")
-
-                        # 检查推文是否存在并获取其keywords值
-                        cursor.execute('SELECT keywords FROM tweets_v2 WHERE tweetID = ?', (tweet_id,))
-                        result = cursor.fetchone()
-
-                        if result:
-                            existing_keywords = result[0]
-                            if existing_keywords is None or existing_keywords.strip() == '':
-                                # 如果推文存在但keywords为空，更新keywords
-                                print(f"Tweet {tweet_id} exists with empty keywords, updating...")
-                                cursor.execute('''
-                                    UPDATE tweets_v2 
-                                    SET keywords = ? 
-                                    WHERE tweetID = ?
-                                ''', (keyword, tweet_id))
-                                print(f"Updated keywords for tweet {tweet_id}")
-                                skipped_tweets.append(f"{tweet_id} (keywords updated)")
-                            else:
-                                print(f"Tweet {tweet_id} already exists with keywords: {existing_keywords}, skipping")
-                                skipped_tweets.append(tweet_id)
-                        else:
-                            # 如果推文不存在，插入新记录
-                            cursor.execute('''
-                                INSERT INTO tweets_v2 (tweetID, Content, CreatedAt, userid, keywords) 
-                                VALUES (?, ?, ?, ?, ?)
-                            ''', (tweet_id, content, created_at, userid, keyword))
-                            print(f"Tweet {tweet_id} inserted successfully")
-                            inserted_tweets.append(tweet_id)
-
-                    except Exception as e:
-                        print(f"Error processing tweet {tweet_index + 1}: {str(e)}")
-                        print(f"Tweet data: {json.dumps(tweet, indent=2)}")
-                        error_tweets.append(tweet_id if tweet_id else "Unknown ID")
-
-            except Exception as e:
-                print(f"Error processing item {item_index + 1}: {str(e)}")
-                print(f"Item data: {json.dumps(item, indent=2)}")
-
-        conn.commit()
-        conn.close()
-
-        print(f"\nOperation completed. Inserted: {len(inserted_tweets)}, Skipped: {len(skipped_tweets)}, Errors: {len(error_tweets)}")
-        return jsonify({
-            "inserted": inserted_tweets,
-            "skipped": skipped_tweets,
-            "errors": error_tweets,
-            "total_processed": len(inserted_tweets) + len(skipped_tweets) + len(error_tweets),
-            "total_inserted": len(inserted_tweets),
-            "total_skipped": len(skipped_tweets),
-            "total_errors": len(error_tweets)
-        }), 200
+        try:
+            with timer.stage('db'):
+                result = ingest_payload(cursor, output_list, rune_names, recent_ids)
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            recent_ids.discard(conn)
+            raise
+
+        with timer.stage('publish'):
+            publish_committed_tweets(conn)
+
+        timer.summary(status=200, inserted=result['total_inserted'],
+                      skipped=result['total_skipped'], errors=result['total_errors'])
+        return jsonify(result), 200
 
     except Exception as e:
-        print(f"Unexpected error in add_all_tweets: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Unexpected error in add_all_tweets: %s", e)
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
 
-def normalize_keyword(keyword):
-    """标准化关键词：将 • 替换为空格"""
-    if keyword:
-        return keyword.replace('•', ' ')
-    return keyword
+# SSE 推送新写入的推文：?keyword=DOG•GO,PUPS（可选，按写入时的检索词过滤），
+# 断线重连时浏览器会带上 Last-Event-ID（也可用 ?last_event_id=），从该位置补发
+@app.route('/stream/tweets', methods=['GET'])
+def stream_tweets():
+    keywords = {normalize_keyword(k.strip()) for k in request.args.get('keyword', '').split(',') if k.strip()}
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+
+    events = tweet_broker.stream(last_event_id, keywords)
+    if events is None:
+        return jsonify({"error": "Too many stream subscribers, retry later"}), 503
+
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/ingest_metrics', methods=['GET'])
+def ingest_metrics():
+    return jsonify({
+        "recent_ids": recent_ids.stats(),
+        "queue_pending": tweet_ingest_queue.pending(),
+        "stream_subscribers": tweet_broker.subscriber_count()
+    }), 200
+
+
+@app.route('/ingest_status/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    job = tweet_ingest_queue.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job), 200
+
+
+# analyze_keywords 的统计窗口：(结果字段名, 天数)
+KEYWORD_PERIODS = [
+    ('3_days', 3),
+    ('7_days', 7),
+    ('15_days', 15),
+    ('30_days', 30),
+    ('90_days', 90)
+]
+
+# 自定义窗口的上限（天）
+MAX_KEYWORD_WINDOW_DAYS = 365
+
+
+def parse_keyword_periods(windows):
+    """解析 ?windows=1,3,7 形式的自定义窗口，未传时使用默认窗口"""
+    if not windows:
+        return KEYWORD_PERIODS
+    message = f"windows must be comma-separated integers between 1 and {MAX_KEYWORD_WINDOW_DAYS}"
+    try:
+        days_list = sorted({int(item) for item in windows.split(',') if item.strip()})
+    except ValueError:
+        raise ValueError(message) from None
+    if not days_list or days_list[0] < 1 or days_list[-1] > MAX_KEYWORD_WINDOW_DAYS:
+        raise ValueError(message)
+    return [(f'{days}_days', days) for days in days_list]
+
 
 @app.route('/analyze_keywords', methods=['GET'])
+@cached_response(response_cache, 'tweets')
 def analyze_keywords():
-    conn = connect_db()
+    timer = RequestTimer(logger, 'analyze_keywords')
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     # 使用 UTC 时间
     now = datetime.now(ZoneInfo("UTC"))
-    
-    # 定义时间范围
-    time_ranges = {
-        '3d': now - timedelta(days=3),
-        '7d': now - timedelta(days=7),
-        '15d': now - timedelta(days=15),
-        '30d': now - timedelta(days=30),
-        '90d': now - timedelta(days=90)
-    }
+
+    try:
+        periods = parse_keyword_periods(request.args.get('windows'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        # 获取所有推文数据
-        query = """
-        SELECT Content, CreatedAt, keywords 
-        FROM tweets_v2 
-        WHERE keywords IS NOT NULL 
-        AND CreatedAt IS NOT NULL
+        # 从 keyword_daily_stats 按天汇总：N 天窗口包含今天在内的 N 个 UTC 自然日，
+        # 每个检索词最多读取最长窗口天数的行，与历史总量无关
+        select_parts = []
+        params = []
+        for _, days in periods:
+            since_day = (now - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            select_parts.append("SUM(CASE WHEN day >= ? THEN posts ELSE 0 END)")
+            select_parts.append("SUM(CASE WHEN day >= ? THEN likes ELSE 0 END)")
+            params.extend([since_day, since_day])
+        max_since_day = (now - timedelta(days=periods[-1][1] - 1)).strftime('%Y-%m-%d')
+
+        query = f"""
+        SELECT keyword, {', '.join(select_parts)}
+        FROM keyword_daily_stats
+        WHERE day >= ?
+        GROUP BY keyword
         """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        # 初始化结果字典
-        stats = {}
-        
-        # 处理每条推文
-        for row in rows:
-            try:
-                content = json.loads(row[0])
-                created_at = row[1]
-                keyword = normalize_keyword(row[2])
-                
-                if not keyword:
-                    continue
-                
-                # 初始化关键词统计
-                if keyword not in stats:
-                    stats[keyword] = {
-                        '3d': {'posts': 0, 'likes': 0},
-                        '7d': {'posts': 0, 'likes': 0},
-                        '15d': {'posts': 0, 'likes': 0},
-                        '30d': {'posts': 0, 'likes': 0},
-                        '90d': {'posts': 0, 'likes': 0}
-                    }
-                
-                # 解析推文日期
-                tweet_date = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y")
-                tweet_date_utc = tweet_date.astimezone(ZoneInfo("UTC"))
-                
-                # 获取点赞数
-                favorite_count = int(content.get('favorite_count', 0))
-                
-                # 更新各时间段的统计数据
-                for period, start_date in time_ranges.items():
-                    if tweet_date_utc >= start_date:
-                        stats[keyword][period]['posts'] += 1
-                        stats[keyword][period]['likes'] += favorite_count
-                
-            except Exception as e:
-                print(f"Error processing row: {str(e)}")
-                continue
+        with timer.stage('db'):
+            cursor.execute(query, params + [max_since_day])
+            rows = cursor.fetchall()
         
         # 格式化结果
         formatted_results = []
-        for keyword, periods in stats.items():
-            result = {
-                'keyword': keyword,
-                'statistics': {
-                    '3_days': {
-                        'post_count': periods['3d']['posts'],
-                        'total_likes': periods['3d']['likes']
-                    },
-                    '7_days': {
-                        'post_count': periods['7d']['posts'],
-                        'total_likes': periods['7d']['likes']
-                    },
-                    '15_days': {
-                        'post_count': periods['15d']['posts'],
-                        'total_likes': periods['15d']['likes']
-                    },
-                    '30_days': {
-                        'post_count': periods['30d']['posts'],
-                        'total_likes': periods['30d']['likes']
-                    },
-                    '90_days': {
-                        'post_count': periods['90d']['posts'],
-                        'total_likes': periods['90d']['likes']
-                    }
+        for row in rows:
+            statistics = {}
+            for index, (label, _) in enumerate(periods):
+                statistics[label] = {
+                    'post_count': row[1 + index * 2] or 0,
+                    'total_likes': row[2 + index * 2] or 0
                 }
-            }
-            formatted_results.append(result)
+            formatted_results.append({
+                'keyword': row[0],
+                'statistics': statistics
+            })
         
-        # 按90天内的发帖量降序排序
+        # 按最长窗口内的发帖量降序排序
+        longest = periods[-1][0]
         formatted_results.sort(
             key=lambda x: (
-                x['statistics']['90_days']['post_count'],
-                x['statistics']['90_days']['total_likes']
+                x['statistics'][longest]['post_count'],
+                x['statistics'][longest]['total_likes']
             ),
             reverse=True
         )
         
+        timer.summary(status=200, keywords=len(formatted_results))
         return jsonify({
             'updated_at': now.strftime('%Y-%m-%d %H:%M:%S UTC'),
             'total_keywords': len(formatted_results),
@@ -607,16 +488,124 @@ def analyze_keywords():
         }), 200
         
     except Exception as e:
-        print(f"Error in analyze_keywords: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Error in analyze_keywords: %s", e)
         return jsonify({
             'error': str(e),
             'timestamp': now.strftime('%Y-%m-%d %H:%M:%S UTC')
         }), 500
-    finally:
-        conn.close()
+
+
+# 搜索结果每页最大条数
+MAX_SEARCH_LIMIT = 200
+
+SEARCH_ORDERS = {
+    'rank': 'score',
+    'likes': 't.favorite_count DESC, score',
+    'recent': 't.created_ts DESC',
+}
+
+
+def build_fts_query(text):
+    """把用户输入拆成带引号的词，各词之间为 AND，避免 FTS5 语法错误"""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+# 全文搜索：?q=关键词 [&days=N | &since=&until= 秒级时间戳] [&keyword=] [&author=screen_name]
+# [&sort=rank|likes|recent] [&limit=50&offset=0]
+@app.route('/search_tweets', methods=['GET'])
+@cached_response(response_cache, 'tweets')
+def search_tweets():
+    timer = RequestTimer(logger, 'search_tweets')
+    args = request.args
+
+    fts_query = build_fts_query(args.get('q', ''))
+    if not fts_query:
+        return jsonify({"error": "Missing search query 'q'"}), 400
+    sort = args.get('sort', 'rank')
+    if sort not in SEARCH_ORDERS:
+        return jsonify({"error": f"sort must be one of {', '.join(SEARCH_ORDERS)}"}), 400
+
+    try:
+        limit = min(int(args.get('limit', 50)), MAX_SEARCH_LIMIT)
+        offset = int(args.get('offset', 0))
+        since = int(args['since']) if args.get('since') else None
+        until = int(args['until']) if args.get('until') else None
+        days = int(args['days']) if args.get('days') else None
+        if limit < 1 or (days is not None and days < 1):
+            raise ValueError
+        if offset < 0 or any(value is not None and value < 0 for value in (since, until)):
+            raise ValueError
+        if days is not None:
+            since = int(datetime.now(ZoneInfo("UTC")).timestamp()) - days * 86400
+    except ValueError:
+        return jsonify({"error": "limit and days must be positive integers; offset, since and until must be non-negative integers"}), 400
+
+    conditions = ["tweets_fts MATCH ?"]
+    params = [fts_query]
+    if since is not None:
+        conditions.append("t.created_ts >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("t.created_ts < ?")
+        params.append(until)
+    if args.get('author'):
+        conditions.append("t.screen_name = ? COLLATE NOCASE")
+        params.append(args['author'])
+    if args.get('keyword'):
+        conditions.append("EXISTS (SELECT 1 FROM tweet_keywords k WHERE k.tweetID = t.tweetID AND k.keyword_normalized = ?)")
+        params.append(normalize_keyword(args['keyword']))
+
+    # bm25 权重：正文 1.0，作者名和 screen_name 各 0.5；分数越小越相关
+    query = f"""
+    SELECT t.tweetID, t.full_text, t.user_name, t.screen_name, t.created_ts, t.favorite_count,
+           bm25(tweets_fts, 1.0, 0.5, 0.5) AS score
+    FROM tweets_fts
+    JOIN tweets_v2 t ON t.rowid = tweets_fts.rowid
+    WHERE {' AND '.join(conditions)}
+    ORDER BY {SEARCH_ORDERS[sort]}
+    LIMIT ? OFFSET ?
+    """
+    cursor = get_read_connection().cursor()
+    try:
+        with timer.stage('db'):
+            cursor.execute(query, params + [limit + 1, offset])
+            rows = cursor.fetchall()
+    except sqlite3.OperationalError as e:
+        logger.warning("Search failed for %r: %s", fts_query, e)
+        return jsonify({"error": f"Invalid search: {e}"}), 400
+
+    has_more = len(rows) > limit
+    shanghai = ZoneInfo("Asia/Shanghai")
+    results = []
+    for tweet_id, full_text, name, screen_name, created_ts, favorite_count, score in rows[:limit]:
+        results.append({
+            "id": tweet_id,
+            "text": unescape_text(full_text),
+            "author": {
+                "name": unescape_text(name),
+                "screen_name": screen_name
+            },
+            "created_at": datetime.fromtimestamp(created_ts, shanghai).strftime("%Y年%m月%d日 %H:%M:%S") if created_ts else None,
+            "created_ts": created_ts,
+            "favorite_count": favorite_count or 0,
+            "link": f"https://twitter.com/{screen_name}/status/{tweet_id}",
+            "score": round(-score, 4)
+        })
+
+    timer.summary(status=200, results=len(results), sort=sort)
+    return jsonify({
+        "results": results,
+        "total": len(results),
+        "offset": offset,
+        "next_offset": offset + limit if has_more else None
+    }), 200
 
 
 if __name__ == '__main__':
+    init_conn = get_connection()
+    ensure_tweets_v2_schema(init_conn.cursor())
+    init_conn.commit()
+    recent_ids.warm(init_conn.cursor())
     app.run(host='0.0.0.0', port=5004, debug=True)
 
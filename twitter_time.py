@@ -0,0 +1,135 @@
+import sys
+import timeit
+from datetime import date, datetime
+from functools import lru_cache
+
+# 专门解析 Twitter 的 "%a %b %d %H:%M:%S %z %Y" 格式，例如
+# "Wed Oct 10 20:19:24 +0000 2018"，直接得到 UTC 秒级时间戳
+TWITTER_TIME_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+WEEKDAYS = {'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'}
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+CACHE_SIZE = 65536
+
+
+def _offset_seconds(offset):
+    """'+0800' 或 '+08:00' 转为秒"""
+    digits = offset[1:].replace(':', '')
+    if len(digits) != 4 or not digits.isdigit() or offset[0] not in '+-':
+        raise ValueError(f"invalid UTC offset: {offset!r}")
+    hours, minutes = int(digits[:2]), int(digits[2:])
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"invalid UTC offset: {offset!r}")
+    sign = -1 if offset[0] == '-' else 1
+    return sign * (hours * 3600 + minutes * 60)
+
+
+def _clock_seconds(clock):
+    """'HH:MM:SS' 转为当天的秒数，与 strptime 一样拒绝越界的时、分、秒"""
+    parts = clock.split(':')
+    if len(parts) != 3 or not all(part.isdigit() and len(part) <= 2 for part in parts):
+        raise ValueError(f"invalid time of day: {clock!r}")
+    hour, minute, second = int(parts[0]), int(parts[1]), int(parts[2])
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError(f"invalid time of day: {clock!r}")
+    return hour * 3600 + minute * 60 + second
+
+
+def _to_epoch(year, month, day, clock, offset):
+    # date() 会校验月份和当月的天数
+    days = date(year, month, day).toordinal() - EPOCH_ORDINAL
+    return days * 86400 + _clock_seconds(clock) - _offset_seconds(offset)
+
+
+def parse_twitter_time(value):
+    """解析 Twitter created_at，返回 UTC 秒级时间戳；格式不对或字段越界时抛出 ValueError"""
+    parts = value.split(' ')
+    if (len(parts) != 6 or parts[0] not in WEEKDAYS or parts[1] not in MONTHS
+            or not (parts[2].isdigit() and len(parts[2]) <= 2)
+            or not (parts[5].isdigit() and len(parts[5]) == 4)):
+        # 不是标准写法的交给 strptime，真正不合法时由它抛出 ValueError
+        return int(datetime.strptime(value, TWITTER_TIME_FORMAT).timestamp())
+    return _to_epoch(int(parts[5]), MONTHS[parts[1]], int(parts[2]), parts[3], parts[4])
+
+
+def parse_iso_time(value):
+    """解析 "%Y-%m-%d %H:%M:%S%z" 格式（旧 tweets 表中 datetime 写入后的样子），返回 UTC 秒级时间戳"""
+    day_part, _, clock = value.partition(' ')
+    if len(clock) < 13:
+        raise ValueError(f"time data {value!r} does not match format '%Y-%m-%d %H:%M:%S%z'")
+    year, month, day = day_part.split('-')
+    if not (year.isdigit() and month.isdigit() and day.isdigit()):
+        raise ValueError(f"time data {value!r} does not match format '%Y-%m-%d %H:%M:%S%z'")
+    return _to_epoch(int(year), int(month), int(day), clock[:8], clock[8:])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def twitter_time_to_epoch(value):
+    """带缓存的 parse_twitter_time，同一条推文的时间常被反复解析；无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return parse_twitter_time(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def any_time_to_epoch(value):
+    """依次尝试 Twitter 格式和 "%Y-%m-%d %H:%M:%S%z" 格式，都失败时返回 None"""
+    if not value:
+        return None
+    for parse in (parse_twitter_time, parse_iso_time):
+        try:
+            return parse(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def twitter_times_to_epochs(values, parse=twitter_time_to_epoch):
+    """批量转换一整列时间字符串，相同的值只解析一次，结果顺序与输入一致"""
+    values = list(values)
+    parsed = {value: parse(value) for value in set(values)}
+    return [parsed[value] for value in values]
+
+
+def benchmark(count=100000):
+    """对比 strptime 与本模块的解析速度，输出每次调用的平均耗时（微秒）"""
+    samples = [f"Wed Oct {day:02d} 20:{minute:02d}:24 +0000 2024" for day in range(1, 29) for minute in range(60)]
+    column = (samples * (count // len(samples) + 1))[:count]
+
+    def run_strptime():
+        for value in column:
+            int(datetime.strptime(value, TWITTER_TIME_FORMAT).timestamp())
+
+    def run_fast():
+        for value in column:
+            parse_twitter_time(value)
+
+    def run_cached():
+        for value in column:
+            twitter_time_to_epoch(value)
+
+    def run_batch():
+        twitter_times_to_epochs(column, parse_twitter_time)
+
+    assert all(int(datetime.strptime(v, TWITTER_TIME_FORMAT).timestamp()) == parse_twitter_time(v) for v in samples)
+
+    results = {}
+    for name, func in (('strptime', run_strptime), ('fast', run_fast), ('cached', run_cached), ('batch', run_batch)):
+        elapsed = min(timeit.repeat(func, number=1, repeat=3))
+        results[name] = elapsed
+        print(f"{name:10s} {elapsed / count * 1e6:8.3f} us/value  x{results['strptime'] / elapsed:6.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
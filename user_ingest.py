@@ -0,0 +1,142 @@
+import time
+
+from db import bump_data_version
+from service_log import get_logger
+
+logger = get_logger('user_ingest')
+
+# 每批写入的行数，同时也是 IN (...) 查询的参数个数上限
+CHUNK_SIZE = 500
+
+# users_v2 保存每个用户的最新状态，再次抓取到时整行更新
+UPSERT_USER_SQL = '''
+    INSERT INTO users_v2 (
+        user_id, screen_name, name, description, location,
+        followers_count, friends_count, listed_count,
+        favourites_count, media_count, created_at,
+        profile_image_url, verified, last_updated
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        screen_name = excluded.screen_name,
+        name = excluded.name,
+        description = excluded.description,
+        location = excluded.location,
+        followers_count = excluded.followers_count,
+        friends_count = excluded.friends_count,
+        listed_count = excluded.listed_count,
+        favourites_count = excluded.favourites_count,
+        media_count = excluded.media_count,
+        created_at = excluded.created_at,
+        profile_image_url = excluded.profile_image_url,
+        verified = excluded.verified,
+        last_updated = excluded.last_updated
+'''
+
+# 同一用户同一秒内重复抓取只保留第一条快照
+INSERT_SNAPSHOT_SQL = '''
+    INSERT OR IGNORE INTO user_snapshots (
+        user_id, ts, followers_count, friends_count,
+        listed_count, favourites_count, media_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def collect_users(output_list):
+    """从 Coze 返回的 output 中提取用户，按 id 去重，保留第一次出现的"""
+    users = []
+    processed_user_ids = set()
+
+    for i, item in enumerate(output_list):
+        if not item.get('data') or not isinstance(item.get('data'), dict):
+            logger.debug("Skipping item %d: Invalid data structure", i + 1)
+            continue
+
+        item_users = item['data'].get('users')
+        if not item_users:
+            logger.debug("Skipping item %d: No users data", i + 1)
+            continue
+
+        for user in item_users:
+            user_id = user.get('id')
+            if not user_id:
+                logger.debug("Skipping user: Missing ID")
+                continue
+
+            if user_id in processed_user_ids:
+                logger.debug("Skipping duplicate user ID: %s", user_id)
+                continue
+
+            users.append(user)
+            processed_user_ids.add(user_id)
+
+    return users
+
+
+def _fetch_existing_user_ids(cursor, user_ids):
+    existing = set()
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT user_id FROM users_v2 WHERE user_id IN ({placeholders})', chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+
+def write_users(cursor, users, now=None):
+    """批量写入用户最新状态和计数快照，不提交事务
+
+    返回 (inserted_users, updated_users, error_users)。缺少 screen_name
+    或 id 不是整数的用户记为错误，其余用户各两条 executemany 写完。
+    有写入时递增 'users' 数据版本。
+    """
+    now = int(now if now is not None else time.time())
+    last_updated = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))
+
+    user_rows = []
+    snapshot_rows = []
+    error_users = []
+    for user in users:
+        user_id = user.get('id')
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            logger.warning("Invalid user id: %s", user_id)
+            error_users.append(str(user_id))
+            continue
+        if not user.get('screen_name'):
+            logger.warning("Missing screen_name for user %s", user_id)
+            error_users.append(str(user_id))
+            continue
+
+        counts = (
+            user.get('followers_count'),
+            user.get('friends_count'),
+            user.get('listed_count'),
+            user.get('favourites_count'),
+            user.get('media_count'),
+        )
+        user_rows.append((
+            user_id,
+            user.get('screen_name'),
+            user.get('name'),
+            user.get('description'),
+            user.get('location'),
+        ) + counts + (
+            user.get('created_at'),
+            user.get('profile_image_url_https'),
+            1 if user.get('verified') else 0,
+            last_updated
+        ))
+        snapshot_rows.append((user_id, now) + counts)
+
+    if not user_rows:
+        return [], [], error_users
+
+    existing = _fetch_existing_user_ids(cursor, [row[0] for row in user_rows])
+    cursor.executemany(UPSERT_USER_SQL, user_rows)
+    cursor.executemany(INSERT_SNAPSHOT_SQL, snapshot_rows)
+    bump_data_version(cursor, 'users')
+
+    inserted_users = [row[0] for row in user_rows if row[0] not in existing]
+    updated_users = [row[0] for row in user_rows if row[0] in existing]
+    return inserted_users, updated_users, error_users
@@ -1,228 +1,190 @@
 from flask import Flask, request, jsonify
-import sqlite3
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import json
-import traceback
-import os
+
+from create_user_table import USER_FOLLOWER_TIERS
+from db import get_connection, get_read_connection, release_thread_connections
+from migrate_users_v2 import ensure_users_v2_schema
+from raw_archive import RawArchive
+from response_cache import ResponseCache, cached_response
+from service_log import get_logger, log_payload, RequestTimer
+from user_ingest import collect_users, write_users
 
 app = Flask(__name__)
 app.config['DEBUG'] = True
+app.teardown_appcontext(release_thread_connections)
+
+logger = get_logger('user_v2')
 
-def connect_db():
-    """连接到数据库"""
-    return sqlite3.connect('/home/lighthouse/tweets.db')
+# 原始请求归档，后台线程追加写入压缩分段
+raw_archive = RawArchive('/home/lighthouse/logs/user_requests', 'user_request')
+
+# GET 接口的响应缓存，/add_users 或推文写入提交后失效
+response_cache = ResponseCache()
 
 @app.route('/add_users', methods=['POST'])
 def add_users():
-    print("\n=== add_users function called ===")
-    print(f"Time: {datetime.now(ZoneInfo('UTC')).strftime('%Y-%m-%d %H:%M:%S UTC')}")
-    
+    timer = RequestTimer(logger, 'add_users')
+
     try:
-        data = request.json
-        print("\n=== Received Full Data ===")
-        print(json.dumps(data, indent=2))
-        print("=== End of Full Data ===\n")
-
-        # 将请求数据保存到文件
-        log_dir = '/home/lighthouse/logs/user_requests'
-        os.makedirs(log_dir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        log_file = f'{log_dir}/user_request_{timestamp}.json'
-        
-        with open(log_file, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"Request data saved to {log_file}")
+        with timer.stage('parse'):
+            data = request.json
+        log_payload(logger, "Received add_users payload", data)
+
+        # 将请求数据追加到归档
+        with timer.stage('archive'):
+            raw_archive.append('add_users', data)
 
         # 验证数据结构
-        print("\n=== Validating Data Structure ===")
         if not data or 'output' not in data or not isinstance(data['output'], list):
-            print("Error: Invalid JSON data received")
+            logger.warning("Invalid JSON data received")
+            timer.summary(status=400)
             return jsonify({"error": "Invalid JSON data received"}), 400
 
         # 提取用户数据
-        users = []
-        processed_user_ids = set()  # 用于跟踪已处理的用户ID
-        print("\n=== Extracting User Data ===")
-        
-        for i, item in enumerate(data['output']):
-            print(f"\nProcessing output item {i+1}/{len(data['output'])}")
-            
-            if not item.get('data') or not isinstance(item.get('data'), dict):
-                print(f"Skipping item {i+1}: Invalid data structure")
-                continue
-                
-            item_users = item['data'].get('users')
-            if not item_users:
-                print(f"Skipping item {i+1}: No users data")
-                continue
-                
-            for user in item_users:
-                user_id = user.get('id')
-                if not user_id:
-                    print("Skipping user: Missing ID")
-                    continue
-                    
-                if user_id in processed_user_ids:
-                    print(f"Skipping duplicate user ID: {user_id}")
-                    continue
-                    
-                users.append(user)
-                processed_user_ids.add(user_id)
-                print(f"Added user {user_id} to processing queue")
+        users = collect_users(data['output'])
 
         if not users:
-            print("Error: No valid users data found")
+            logger.warning("No valid users data found")
+            timer.summary(status=400)
             return jsonify({"error": "No valid users data found"}), 400
 
-        print(f"\nTotal unique users extracted: {len(users)}")
+        logger.debug("Total unique users extracted: %d", len(users))
 
-        # 数据库操作
-        print("\n=== Database Operations ===")
-        conn = connect_db()
+        # 数据库操作：最新状态 upsert 与快照追加各一次 executemany
+        conn = get_connection()
         cursor = conn.cursor()
 
-        inserted_users = []
-        error_users = []
-
-        # 处理每个用户
-        print("\n=== Processing Users ===")
-        for i, user in enumerate(users):
-            try:
-                print(f"\nProcessing user {i+1}/{len(users)}")
-                user_id = user.get('id')
-                
-                if not user_id:
-                    print("Error: Missing user ID")
-                    raise ValueError("Missing user ID")
-                
-                print(f"User ID: {user_id}")
-                print(f"Screen Name: {user.get('screen_name')}")
-
-                current_time = datetime.now(ZoneInfo("UTC")).strftime('%Y-%m-%d %H:%M:%S')
-                
-                user_data = (
-                    user_id,
-                    user.get('screen_name'),
-                    user.get('name'),
-                    user.get('description'),
-                    user.get('location'),
-                    user.get('followers_count'),
-                    user.get('friends_count'),
-                    user.get('listed_count'),
-                    user.get('favourites_count'),
-                    user.get('media_count'),
-                    user.get('created_at'),
-                    user.get('profile_image_url_https'),
-                    1 if user.get('verified') else 0,
-                    current_time
-                )
-                
-                print("Prepared user data:")
-                print(json.dumps({
-                    'user_id': user_data[0],
-                    'screen_name': user_data[1],
-                    'followers_count': user_data[5],
-                    'friends_count': user_data[6],
-                    'last_updated': user_data[13]
-                }, indent=2))
-
-                # 插入新记录
-                cursor.execute('''
-                    INSERT INTO users_v2 (
-                        user_id, screen_name, name, description, location,
-                        followers_count, friends_count, listed_count,
-                        favourites_count, media_count, created_at,
-                        profile_image_url, verified, last_updated
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', user_data)
-                
-                inserted_users.append(user_id)
-                print(f"Inserted new record for user {user_id}")
-
-            except sqlite3.IntegrityError as e:
-                print(f"\nDatabase integrity error for user {user_id}: {str(e)}")
-                print(f"Full error traceback: {traceback.format_exc()}")
-                error_users.append(str(user_id))
-            except Exception as e:
-                print(f"\nError processing user: {str(e)}")
-                print(f"Full error traceback: {traceback.format_exc()}")
-                print(f"User data: {json.dumps(user, indent=2)}")
-                error_users.append(str(user_id) if user_id else "Unknown ID")
-
-        # 提交事务
-        print("\n=== Finalizing Database Operations ===")
-        print("Committing changes...")
-        conn.commit()
-        print("Changes committed successfully")
-        conn.close()
-        print("Database connection closed")
-
-        # 返回结果
-        print("\n=== Operation Summary ===")
-        print(f"Total processed: {len(users)}")
-        print(f"Inserted: {len(inserted_users)}")
-        print(f"Errors: {len(error_users)}")
+        with timer.stage('db'):
+            inserted_users, updated_users, error_users = write_users(cursor, users)
+            conn.commit()
+
+        timer.summary(status=200, users=len(users), inserted=len(inserted_users),
+                      updated=len(updated_users), errors=len(error_users))
 
         return jsonify({
             "inserted": inserted_users,
+            "updated": updated_users,
             "errors": error_users,
             "total_processed": len(users),
             "total_inserted": len(inserted_users),
+            "total_updated": len(updated_users),
             "total_errors": len(error_users)
         }), 200
 
     except Exception as e:
-        print(f"\n=== Unexpected Error ===")
-        print(f"Error message: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Unexpected error in add_users: %s", e)
+        get_connection().rollback()
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
+# 粉丝数均值的默认统计窗口：(结果字段名, 天数)
+FOLLOWER_WINDOWS = [
+    ('3d', 3),
+    ('7d', 7),
+    ('15d', 15),
+    ('30d', 30),
+    ('90d', 90),
+]
+
+MAX_FOLLOWER_WINDOW_DAYS = 365
+
+# user_ids / screen_names 过滤时最多的个数
+MAX_FILTER_USERS = 500
+
+
+def parse_follower_windows(windows):
+    """解析 ?windows=1,3,7 形式的自定义窗口，未传时使用默认窗口"""
+    if not windows:
+        return FOLLOWER_WINDOWS
+    message = f"windows must be comma-separated integers between 1 and {MAX_FOLLOWER_WINDOW_DAYS}"
+    try:
+        days_list = sorted({int(item) for item in windows.split(',') if item.strip()})
+    except ValueError:
+        raise ValueError(message) from None
+    if not days_list or days_list[0] < 1 or days_list[-1] > MAX_FOLLOWER_WINDOW_DAYS:
+        raise ValueError(message)
+    return [(f'{days}d', days) for days in days_list]
+
+
+def parse_list_arg(name, value, convert=str):
+    """解析逗号分隔的参数，未传时返回空列表"""
+    if not value:
+        return []
+    try:
+        items = [convert(item.strip()) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid value in {name}")
+    if len(items) > MAX_FILTER_USERS:
+        raise ValueError(f"At most {MAX_FILTER_USERS} users per request")
+    return items
+
+
 @app.route('/get_user_follower_averages', methods=['GET'])
+@cached_response(response_cache, 'users')
 def get_user_follower_averages():
-    print("get_user_follower_averages function called")
     try:
-        conn = connect_db()
+        windows = parse_follower_windows(request.args.get('windows'))
+        user_ids = parse_list_arg('user_ids', request.args.get('user_ids'), int)
+        screen_names = parse_list_arg('screen_names', request.args.get('screen_names'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        conn = get_read_connection()
         cursor = conn.cursor()
 
         now = datetime.now(ZoneInfo("UTC"))
-        
-        time_ranges = {
-            '3d': 3,
-            '7d': 7,
-            '15d': 15,
-            '30d': 30,
-            '90d': 90
-        }
-
-        user_follower_averages = {}
-
-        for range_key, days in time_ranges.items():
-            start_date = (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-            query = '''
-                SELECT user_id, screen_name, AVG(followers_count) as avg_followers
-                FROM users_v2
-                WHERE last_updated >= ?
-                GROUP BY user_id, screen_name
-            '''
-            cursor.execute(query, (start_date,))
-            rows = cursor.fetchall()
-
-            for row in rows:
-                user_id, screen_name, avg_followers = row
-                if user_id not in user_follower_averages:
-                    user_follower_averages[user_id] = {
-                        'screen_name': screen_name,
-                        'averages': {}
-                    }
-                user_follower_averages[user_id]['averages'][range_key] = avg_followers
+
+        # 原始快照及小时、天压缩层各扫描一次最长窗口内的行，按条件聚合出各窗口的
+        # 粉丝数之和与样本数，再按用户合并求均值；指定用户时按 (user_id, ts) 主键范围读取
+        starts = [int((now - timedelta(days=days)).timestamp()) for _, days in windows]
+
+        user_filters = []
+        filter_params = []
+        if user_ids:
+            user_filters.append(f"user_id IN ({','.join('?' * len(user_ids))})")
+            filter_params.extend(user_ids)
+        if screen_names:
+            user_filters.append(
+                f"user_id IN (SELECT user_id FROM users_v2 WHERE screen_name IN ({','.join('?' * len(screen_names))}))"
+            )
+            filter_params.extend(screen_names)
+
+        tier_queries = []
+        params = []
+        for table, ts_column, sum_expr, samples_expr, _ in USER_FOLLOWER_TIERS:
+            select_parts = []
+            for index, start in enumerate(starts):
+                select_parts.append(f"SUM(CASE WHEN {ts_column} >= ? THEN {sum_expr} END) AS sum_{index}")
+                select_parts.append(f"SUM(CASE WHEN {ts_column} >= ? THEN {samples_expr} END) AS samples_{index}")
+                params.extend([start, start])
+            tier_queries.append(f'''
+                SELECT user_id, {', '.join(select_parts)}
+                FROM {table}
+                WHERE {ts_column} >= ? {''.join(' AND ' + condition for condition in user_filters)}
+                GROUP BY user_id''')
+            params.append(min(starts))
+            params.extend(filter_params)
+
+        average_parts = [f"SUM(t.sum_{index}) * 1.0 / SUM(t.samples_{index})" for index in range(len(starts))]
+        query = f'''
+            SELECT t.user_id, u.screen_name, {', '.join(average_parts)}
+            FROM ({' UNION ALL '.join(tier_queries)}) t
+            JOIN users_v2 u ON u.user_id = t.user_id
+            GROUP BY t.user_id
+        '''
+        cursor.execute(query, params)
 
         formatted_averages = []
-        for user_id, data in user_follower_averages.items():
+        for row in cursor.fetchall():
             formatted_averages.append({
-                'user_id': user_id,
-                'screen_name': data['screen_name'],
-                'averages': data['averages']
+                'user_id': row[0],
+                'screen_name': row[1],
+                'averages': {
+                    range_key: avg_followers
+                    for (range_key, _), avg_followers in zip(windows, row[2:])
+                    if avg_followers is not None
+                }
             })
 
         return jsonify({
@@ -232,84 +194,241 @@ def get_user_follower_averages():
         }), 200
 
     except Exception as e:
-        print(f"Error in get_user_follower_averages: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Error in get_user_follower_averages: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+
+GROWTH_SORT_FIELDS = ('pct', 'change', 'per_day')
+
+# 计算日均增长所需的最短基线跨度：至少一小时（一个小时层时段），且不少于窗口的 1/10，
+# 否则刚开始跟踪的用户几秒内的变化会被放大成极大的日均值
+GROWTH_MIN_SPAN_SECONDS = 3600
+GROWTH_MIN_SPAN_FRACTION = 0.1
+
+
+def growth_min_span(days):
+    return max(GROWTH_MIN_SPAN_SECONDS, int(days * 86400 * GROWTH_MIN_SPAN_FRACTION))
+
+
+def growth_per_day(change, latest_ts, since, days):
+    """窗口内的日均增长；基线跨度不足 growth_min_span(days) 时返回 None"""
+    if change is None or since is None or latest_ts - since < growth_min_span(days):
+        return None
+    return change * 86400.0 / (latest_ts - since)
+
+
+def query_follower_growth(cursor, windows, now_ts, sort_field, sort_window, top=None, min_followers=0,
+                          user_ids=None, screen_names=None):
+    """按用户计算各窗口内的粉丝变化，返回 [(user_id, screen_name, latest_ts, latest, change, since, ...)]
+
+    最新值取 users_v2，窗口起点取窗口内最早的一次快照（压缩层中为最后一次快照落在窗口内的
+    最早时段，since 取该快照的 last_ts），
+    每个用户每个窗口在各层各一次 (user_id, ts) 主键定位，耗时只与用户数有关，与快照条数无关。
+    窗口内只有最新一次快照（或没有快照）时该窗口的 change 为 NULL。
+    按 per_day 排序时基线跨度不足 growth_min_span 的用户排在最后。
+    """
+    params = []
+    baseline_parts = []
+    growth_parts = []
+    for index, (_, days) in enumerate(windows):
+        start = now_ts - days * 86400
+        # 各层按时间从旧到新排列，第一个在窗口内有数据的层给出最早的快照
+        since_lookups = []
+        base_lookups = []
+        for table, ts_column, _, _, sample_ts_column in USER_FOLLOWER_TIERS:
+            # 时段最长一天，时间列条件只用来缩小主键扫描范围，是否在窗口内以快照时间为准
+            first_row = (f"FROM {table} s WHERE s.user_id = u.user_id AND s.{ts_column} > ? "
+                         f"AND s.{sample_ts_column} >= ? ORDER BY s.{ts_column} LIMIT 1")
+            since_lookups.append(f"(SELECT s.{sample_ts_column} {first_row})")
+            base_lookups.append(f"(SELECT s.followers_count {first_row})")
+        baseline_parts.append(f"COALESCE({', '.join(since_lookups)}) AS since_{index}")
+        baseline_parts.append(f"COALESCE({', '.join(base_lookups)}) AS base_{index}")
+        params.extend([start - 86400, start] * len(since_lookups + base_lookups))
+        growth_parts.append(f"CASE WHEN since_{index} < latest_ts THEN latest - base_{index} END AS change_{index}")
+        growth_parts.append(f"since_{index}")
+
+    filters = ["u.followers_count >= ?"]
+    params.append(min_followers)
+    if user_ids:
+        filters.append(f"u.user_id IN ({','.join('?' * len(user_ids))})")
+        params.extend(user_ids)
+    if screen_names:
+        filters.append(f"u.screen_name IN ({','.join('?' * len(screen_names))})")
+        params.extend(screen_names)
+
+    sort_index = [range_key for range_key, _ in windows].index(sort_window)
+    change, since = f"change_{sort_index}", f"since_{sort_index}"
+    min_span = growth_min_span(windows[sort_index][1])
+    sort_expr = {
+        'change': change,
+        'pct': f"{change} * 100.0 / NULLIF(latest - {change}, 0)",
+        'per_day': f"CASE WHEN latest_ts - {since} >= {min_span} THEN {change} * 86400.0 / (latest_ts - {since}) END",
+    }[sort_field]
+
+    query = f'''
+        WITH baselines AS (
+            SELECT u.user_id, u.screen_name,
+                   CAST(strftime('%s', u.last_updated) AS INTEGER) AS latest_ts,
+                   u.followers_count AS latest,
+                   {', '.join(baseline_parts)}
+            FROM users_v2 u
+            WHERE {' AND '.join(filters)}
+        )
+        SELECT user_id, screen_name, latest_ts, latest, {', '.join(growth_parts)}
+        FROM baselines
+        ORDER BY {sort_expr} DESC NULLS LAST
+        {'LIMIT ?' if top is not None else ''}
+    '''
+    if top is not None:
+        params.append(top)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+@app.route('/user_growth', methods=['GET'])
+@cached_response(response_cache, 'users')
+def user_growth():
+    """各窗口内的粉丝变化量、变化百分比和日均增长
+
+    ?windows=1,7,30 统计窗口（天），?sort=pct|change|per_day 与 ?window=7 指定排序依据
+    （默认最短窗口的 pct），?top=N 只返回前 N 个用户，?min_followers=N 过滤小号，
+    ?user_ids= / ?screen_names= 只统计指定用户。
+    """
+    try:
+        windows = parse_follower_windows(request.args.get('windows'))
+        user_ids = parse_list_arg('user_ids', request.args.get('user_ids'), int)
+        screen_names = parse_list_arg('screen_names', request.args.get('screen_names'))
+        top = int(request.args['top']) if 'top' in request.args else None
+        min_followers = int(request.args.get('min_followers', 0))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    sort_field = request.args.get('sort', 'pct')
+    if sort_field not in GROWTH_SORT_FIELDS:
+        return jsonify({"error": f"sort must be one of {', '.join(GROWTH_SORT_FIELDS)}"}), 400
+    sort_window = f"{request.args['window']}d" if 'window' in request.args else windows[0][0]
+    if sort_window not in [range_key for range_key, _ in windows]:
+        return jsonify({"error": "window must be one of windows"}), 400
+    if top is not None and top < 1:
+        return jsonify({"error": "top must be positive"}), 400
+
+    try:
+        cursor = get_read_connection().cursor()
+        now = datetime.now(ZoneInfo("UTC"))
+        rows = query_follower_growth(cursor, windows, int(now.timestamp()), sort_field, sort_window,
+                                     top, min_followers, user_ids, screen_names)
+
+        growth = []
+        for row in rows:
+            user_id, screen_name, latest_ts, latest = row[:4]
+            window_stats = {}
+            for index, (range_key, days) in enumerate(windows):
+                change, since = row[4 + index * 2], row[5 + index * 2]
+                if change is None:
+                    continue
+                baseline = latest - change
+                per_day = growth_per_day(change, latest_ts, since, days)
+                window_stats[range_key] = {
+                    'change': change,
+                    'pct': round(change * 100.0 / baseline, 4) if baseline else None,
+                    'per_day': round(per_day, 2) if per_day is not None else None,
+                    'since': datetime.fromtimestamp(since, ZoneInfo("UTC")).strftime('%Y-%m-%d %H:%M:%S UTC'),
+                }
+            growth.append({
+                'user_id': user_id,
+                'screen_name': screen_name,
+                'followers_count': latest,
+                'latest_at': datetime.fromtimestamp(latest_ts, ZoneInfo("UTC")).strftime('%Y-%m-%d %H:%M:%S UTC'),
+                'growth': window_stats
+            })
+
+        return jsonify({
+            'total_users': len(growth),
+            'updated_at': now.strftime('%Y-%m-%d %H:%M:%S UTC'),
+            'sort': sort_field,
+            'window': sort_window,
+            'users': growth
+        }), 200
+
+    except Exception as e:
+        logger.exception("Error in user_growth: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+# 作者发推统计的窗口：(结果字段名, 天数)
+USER_STATS_WINDOWS = [
+    ('3d', 3),
+    ('7d', 7),
+    ('15d', 15),
+    ('30d', 30),
+    ('90d', 90),
+]
+
+USER_STATS_SORT_FIELDS = ('tweets', 'likes', 'retweets')
+
 
 # API to get user statistics
 @app.route('/get_user_stats', methods=['GET'])
+@cached_response(response_cache, 'tweets')
 def get_user_stats():
-    print("get_user_stats function called")
+    # ?sort=tweets|likes|retweets 按最长窗口内的该项排序，?top=N 只返回前 N 个作者
+    sort = request.args.get('sort', 'tweets')
+    if sort not in USER_STATS_SORT_FIELDS:
+        return jsonify({"error": f"sort must be one of {', '.join(USER_STATS_SORT_FIELDS)}"}), 400
+    try:
+        top = int(request.args['top']) if 'top' in request.args else None
+    except ValueError:
+        return jsonify({"error": "top must be an integer"}), 400
+    if top is not None and top < 1:
+        return jsonify({"error": "top must be positive"}), 400
+
     try:
-        conn = connect_db()
+        conn = get_read_connection()
         cursor = conn.cursor()
 
         # 获取当前UTC时间
         now = datetime.now(ZoneInfo("UTC"))
-        
-        # 定义时间范围
-        time_ranges = {
-            '3d': 3,
-            '7d': 7,
-            '15d': 15,
-            '30d': 30,
-            '90d': 90
-        }
-
-        # 获取所有用户的推文
-        query = """
-        SELECT Content, CreatedAt 
-        FROM tweets_v2 
-        WHERE CreatedAt >= datetime('now', '-90 days')
-        ORDER BY CreatedAt DESC
-        """
-        cursor.execute(query)
-        rows = cursor.fetchall()
 
-        # 用户统计数据
-        user_stats = {}
-
-        # 处理每条推文
-        for row in rows:
-            content = json.loads(row[0])
-            created_at = datetime.strptime(row[1], "%a %b %d %H:%M:%S %z %Y")
-            
-            user = content.get('user', {})
-            screen_name = user.get('screen_name')
-
-            if not screen_name:
-                continue
-
-            if screen_name not in user_stats:
-                user_stats[screen_name] = {
-                    '3d': 0,
-                    '7d': 0,
-                    '15d': 0,
-                    '30d': 0,
-                    '90d': 0
-                }
-
-            # 计算天数差
-            days_diff = (now - created_at).days
-
-            # 更新各时间范围的统计
-            for range_key, days in time_ranges.items():
-                if days_diff <= days:
-                    user_stats[screen_name][range_key] += 1
+        # 从 author_daily_stats 按天汇总：N 天窗口包含今天在内的 N 个 UTC 自然日，
+        # 每个作者最多读取 90 行。screen_name 取该作者最近一天记录的
+        select_parts = []
+        params = []
+        for _, days in USER_STATS_WINDOWS:
+            since_day = (now - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            for field in USER_STATS_SORT_FIELDS:
+                select_parts.append(f"SUM(CASE WHEN day >= ? THEN {field} ELSE 0 END)")
+                params.append(since_day)
+        max_since_day = (now - timedelta(days=USER_STATS_WINDOWS[-1][1] - 1)).strftime('%Y-%m-%d')
+
+        # 最长窗口的各项在结果中的列号，用于排序
+        sort_column = 4 + (len(USER_STATS_WINDOWS) - 1) * len(USER_STATS_SORT_FIELDS) \
+            + USER_STATS_SORT_FIELDS.index(sort)
+        query = f"""
+        SELECT userid, screen_name, MAX(day), {', '.join(select_parts)}
+        FROM author_daily_stats
+        WHERE day >= ?
+        GROUP BY userid
+        ORDER BY {sort_column} DESC
+        {'LIMIT ?' if top is not None else ''}
+        """
+        params.append(max_since_day)
+        if top is not None:
+            params.append(top)
+        cursor.execute(query, params)
 
         # 格式化结果
         formatted_stats = []
-        for screen_name, tweet_counts in user_stats.items():
-            user_data = {
-                'screen_name': screen_name,
-                'tweet_counts': tweet_counts
-            }
-            formatted_stats.append(user_data)
-
-        # 按90天推文数量排序
-        formatted_stats.sort(key=lambda x: x['tweet_counts']['90d'], reverse=True)
+        for row in cursor.fetchall():
+            totals = row[3:]
+            stats = {field: {} for field in USER_STATS_SORT_FIELDS}
+            for window_index, (range_key, _) in enumerate(USER_STATS_WINDOWS):
+                for field_index, field in enumerate(USER_STATS_SORT_FIELDS):
+                    stats[field][range_key] = totals[window_index * len(USER_STATS_SORT_FIELDS) + field_index]
+            formatted_stats.append({
+                'userid': row[0],
+                'screen_name': row[1],
+                'tweet_counts': stats['tweets'],
+                'likes': stats['likes'],
+                'retweets': stats['retweets']
+            })
 
         return jsonify({
             'total_users': len(formatted_stats),
@@ -318,11 +437,10 @@ def get_user_stats():
         }), 200
 
     except Exception as e:
-        print(f"Error in get_user_stats: {str(e)}")
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Error in get_user_stats: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 if __name__ == '__main__':
+    ensure_users_v2_schema(get_connection().cursor())
+    get_connection().commit()
     app.run(host='0.0.0.0', port=5010, debug=True)